@@ -1,103 +1,87 @@
 from fastapi import APIRouter, HTTPException, Query, Form
 from typing import List, Optional
 from pydantic import BaseModel
-# Simple document class to replace Haystack Document
-class SimpleDocument:
-    def __init__(self, content: str, meta: dict = None):
-        self.content = content
-        self.meta = meta or {}
-        self.id = meta.get('id') if meta else None
 import logging
 import unicodedata
-from collections import defaultdict
 import asyncio
 import os
 import re
+from util.docstore import compile_access_predicate, fetch_docs_filtered, get_doc_tags, is_admin, parse_tags, run_store_call
 
 router = APIRouter()
 
+# Leading dotted section number, e.g. "3.2.1" in "3.2.1 계통 구성"
+_SECTION_NUMBER_RE = re.compile(r'^(\d+(?:\.\d+)*)')
+
 class DuplicateCheckRequest(BaseModel):
     filenames: List[str]
     sosok: Optional[str] = None
     site: Optional[str] = None
 
-def check_document_access(doc_meta, sosok, site):
-    """Check if user has access to document based on sosok/site permissions"""
-    doc_sosok = doc_meta.get("sosok", "").strip()
-    doc_site = doc_meta.get("site", "").strip()
-    
-    # Admin access - can see everything
-    if sosok == "관리자" and site == "관리자":
-        return True
-    
-    # Must match sosok
-    if sosok and doc_sosok != sosok:
-        return False
-    
-    # Check site access
-    if site:
-        # Check for department-wide access (e.g., "레이더관제부_전체")
-        if site.endswith("_전체"):
-            # Allow access to all sites in the same sosok
-            # When site is "부서_전체", user can see all sites in that sosok
-            return True
-        else:
-            # Exact site match required
-            if doc_site != site:
-                return False
-    
-    return True
+def section_sort_key(id_str, _match=_SECTION_NUMBER_RE.match):
+    """Sort key for dotted section ids ("3.2.1" -> [3, 2, 1]); unnumbered sections sort last"""
+    match = _match(id_str)
+    if not match:
+        return [999]
+    return [int(part) for part in match.group(1).split(".")]
+
+def remove_uploaded_files(file_ids, upload_dir="./uploads"):
+    """Delete stored upload files belonging to file_ids (blocking disk I/O; run in a thread)"""
+    deleted_files = []
+    file_ids = [fid for fid in file_ids if fid]
+    if not file_ids:
+        return deleted_files
+    # One directory scan for all file_ids instead of one per file_id
+    with os.scandir(upload_dir) as entries:
+        for entry in entries:
+            f = entry.name
+            if any(fid in f for fid in file_ids):
+                try:
+                    os.remove(entry.path)
+                    deleted_files.append(f)
+                    logging.info(f"🗑 Deleted file from disk: {f}")
+                except Exception as e:
+                    logging.warning(f"⚠ Failed to delete uploaded file {f}: {e}")
+    return deleted_files
 
 def get_documents_router(vector_store):
     @router.get("/list-documents/")
     async def list_documents(sosok: Optional[str] = Query(None), site: Optional[str] = Query(None)):
         try:
-            loop = asyncio.get_event_loop()
-            docs = await loop.run_in_executor(None, lambda: vector_store.filter_documents(filters={}))
-
-            # Apply enhanced permission filtering
-            filtered_docs = []
-            for doc in docs:
-                meta = doc.meta or {}
-                if check_document_access(meta, sosok, site):
-                    filtered_docs.append(doc)
+            # Permission filtering is done by the store
+            filtered_docs = await fetch_docs_filtered(vector_store, sosok, site)
 
-            # Rest of the logic is unchanged
-            page_count = defaultdict(int)
-            pdf_page_total = defaultdict(int)
-            page_numbers = defaultdict(set)
+            # Single pass: the first chunk of each file provides its entry, later chunks add counts/pages
+            files = {}
+            page_numbers = {}
 
             for doc in filtered_docs:
                 meta = doc.meta or {}
                 file_id = meta.get("file_id", "")
-                page_count[file_id] += 1
+                entry = files.get(file_id)
+                if entry is None:
+                    entry = files[file_id] = {
+                        "id": doc.id,
+                        "filename": meta.get("original_filename", "unknown.pdf"),
+                        "tags": get_doc_tags(meta),
+                        "file_id": file_id,
+                        "num_sections": 0,
+                        "total_pdf_pages": 0,
+                        "page_numbers": [],
+                        "sosok": meta.get("sosok", ""),
+                        "site": meta.get("site", "")
+                    }
+                    page_numbers[file_id] = set()
+
+                entry["num_sections"] += 1
                 if "page_number" in meta:
                     page_numbers[file_id].add(meta["page_number"])
-                if "total_pdf_pages" in meta and pdf_page_total.get(file_id, 0) == 0:
-                    pdf_page_total[file_id] = meta["total_pdf_pages"]
+                if not entry["total_pdf_pages"] and "total_pdf_pages" in meta:
+                    entry["total_pdf_pages"] = meta["total_pdf_pages"]
 
-            result = []
-            seen_files = set()
-
-            for doc in filtered_docs:
-                meta = doc.meta or {}
-                file_id = meta.get("file_id", "")
-                if file_id in seen_files:
-                    continue
-                seen_files.add(file_id)
-
-                result.append({
-                    "id": doc.id,
-                    "filename": meta.get("original_filename", "unknown.pdf"),
-                    "tags": [tag.strip() for tag in meta.get("tags", "").split(",") if tag.strip()]
-                            if isinstance(meta.get("tags", ""), str) else [],
-                    "file_id": file_id,
-                    "num_sections": page_count.get(file_id, 0),
-                    "total_pdf_pages": pdf_page_total.get(file_id, 0),
-                    "page_numbers": sorted(list(page_numbers.get(file_id, set()))),
-                    "sosok": meta.get("sosok", ""),
-                    "site": meta.get("site", "")
-                })
+            result = list(files.values())
+            for entry in result:
+                entry["page_numbers"] = sorted(page_numbers[entry["file_id"]])
 
             return {"documents": result}
 
@@ -109,52 +93,51 @@ def get_documents_router(vector_store):
     async def check_duplicate(request: DuplicateCheckRequest):
         """Check if files with the same names already exist in the same sosok/site"""
         try:
-            loop = asyncio.get_event_loop()
-            docs = await loop.run_in_executor(None, lambda: vector_store.filter_documents(filters={}))
-            
             # Extract from request body
             filenames = request.filenames
-            sosok = request.sosok.strip() if request.sosok else ""
-            site = request.site.strip() if request.site else ""
+            sosok = unicodedata.normalize("NFC", request.sosok.strip()) if request.sosok else ""
+            site = unicodedata.normalize("NFC", request.site.strip()) if request.site else ""
             normalized_filenames = [unicodedata.normalize("NFC", f.strip()) for f in filenames]
             
             # Log for debugging
             logging.info(f"🔍 Checking duplicates for: {normalized_filenames} in sosok='{sosok}', site='{site}'")
             
+            if not normalized_filenames:
+                return {"duplicates": []}
+            
+            # For duplicate check, we need exact match (not permission-based)
+            filters = {
+                "sosok": sosok,
+                "site": site,
+                "original_filename": sorted(set(normalized_filenames))
+            }
+            docs = await run_store_call(vector_store.filter_documents, filters=filters, include_content=False)
+            
             # Find duplicates - Fixed to check all files
             duplicates = []
-            file_info_map = {}  # Track file info by filename
+            file_info_map = {}  # Track file info by file_id
+            files_by_name = {}  # filename -> file infos, for O(1) lookup per requested filename
             
-            # First, collect all unique files with matching criteria
+            # First, collect all unique files (the store already matched sosok/site/filename)
             for doc in docs:
                 meta = doc.meta or {}
-                doc_filename = meta.get("original_filename", "").strip()
-                doc_sosok = meta.get("sosok", "").strip()
-                doc_site = meta.get("site", "").strip()
+                doc_filename = meta.get("original_filename", "")
                 doc_file_id = meta.get("file_id", "")
                 
-                # Check if this document matches our criteria
-                # For duplicate check, we need exact match (not permission-based)
-                if (doc_sosok == sosok and 
-                    doc_site == site and 
-                    doc_filename in normalized_filenames):
-                    
-                    # Use file_id as unique key to avoid duplicate entries for same file
-                    if doc_file_id not in file_info_map:
-                        file_info_map[doc_file_id] = {
-                            "filename": doc_filename,
-                            "file_id": doc_file_id,
-                            "upload_date": meta.get("upload_date", ""),
-                            "tags": meta.get("tags", "")
-                        }
-                        logging.info(f"✅ Duplicate found: {doc_filename} (file_id: {doc_file_id})")
+                # Use file_id as unique key to avoid duplicate entries for same file
+                if doc_file_id not in file_info_map:
+                    file_info_map[doc_file_id] = {
+                        "filename": doc_filename,
+                        "file_id": doc_file_id,
+                        "upload_date": meta.get("upload_date", ""),
+                        "tags": meta.get("tags", "")
+                    }
+                    files_by_name.setdefault(doc_filename, []).append(file_info_map[doc_file_id])
+                    logging.info(f"✅ Duplicate found: {doc_filename} (file_id: {doc_file_id})")
             
             # Now check each requested filename and add ALL duplicates
             for filename in normalized_filenames:
-                duplicates_for_this_file = []
-                for file_info in file_info_map.values():
-                    if file_info["filename"] == filename:
-                        duplicates_for_this_file.append(file_info)
+                duplicates_for_this_file = files_by_name.get(filename, [])
                 
                 # Add all duplicates for this filename
                 duplicates.extend(duplicates_for_this_file)
@@ -196,41 +179,22 @@ def get_documents_router(vector_store):
             
             logging.info(f"🏷️ Updating tags for file_id: {file_id} with tags: {tags}")
             
-            loop = asyncio.get_event_loop()
-            docs = await loop.run_in_executor(None, lambda: vector_store.filter_documents(filters={}))
+            docs = await run_store_call(vector_store.filter_documents, filters={"file_id": file_id}, include_content=False)
             
-            # Find all documents with this file_id
-            matching_docs = []
-            for doc in docs:
-                meta = doc.meta or {}
-                if meta.get("file_id", "") == file_id:
-                    # Check if user has permission to update this document
-                    if check_document_access(meta, sosok, site):
-                        matching_docs.append(doc)
-                    else:
-                        raise HTTPException(status_code=403, detail="Permission denied")
+            # Check if user has permission to update these documents (admins always do)
+            if not is_admin(sosok, site):
+                can_access = compile_access_predicate(sosok, site)
+                if not all(can_access(doc.meta or {}) for doc in docs):
+                    raise HTTPException(status_code=403, detail="Permission denied")
+            matching_docs = docs
             
             if not matching_docs:
                 raise HTTPException(status_code=404, detail="Document not found")
             
-            # Update tags for all matching documents
-            updated_count = 0
-            for doc in matching_docs:
-                # Update the metadata
-                doc.meta["tags"] = tags
-                
-                # Delete and re-add the document with updated metadata
-                # Since Haystack doesn't have a direct update_document_meta method
-                vector_store.delete_documents(document_ids=[doc.id])
-                
-                # Create new document with updated metadata
-                new_doc = SimpleDocument(
-                    content=doc.content,
-                    meta=doc.meta,
-                    embedding=doc.embedding
-                )
-                vector_store.write_documents([new_doc])
-                updated_count += 1
+            # Update tags for all matching documents in place - one request, embeddings untouched
+            new_meta = {"tags": tags, "tags_list": parse_tags(tags)}
+            await run_store_call(vector_store.update_documents_meta, {"file_id": file_id}, new_meta)
+            updated_count = len(matching_docs)
             
             logging.info(f"✅ Updated tags for {updated_count} documents with file_id: {file_id}")
             
@@ -261,44 +225,34 @@ def get_documents_router(vector_store):
             file_id = unicodedata.normalize("NFC", file_id.strip()) if file_id else None
             filename = unicodedata.normalize("NFC", filename.strip()) if filename else None
 
-            loop = asyncio.get_event_loop()
-            docs = await loop.run_in_executor(None, lambda: vector_store.filter_documents(filters={}))
+            # Check permission before deletion - the store only returns accessible documents
+            identifier_filters = []
+            if file_id:
+                identifier_filters.append({"file_id": file_id})
+            if filename:
+                identifier_filters.append({"original_filename": filename})
 
             ids_to_delete = []
+            seen_ids = set()  # O(1) membership; ids_to_delete keeps the order
             deleted_file_ids = set()
 
-            for doc in docs:
-                meta = doc.meta or {}
-                doc_file_id = meta.get("file_id", "").strip()
-                doc_filename = meta.get("original_filename", "").strip()
-
-                # Check permission before deletion
-                if not check_document_access(meta, sosok, site):
-                    continue
-
-                if file_id and doc_file_id == file_id:
-                    ids_to_delete.append(doc.id)
-                    deleted_file_ids.add(doc_file_id)
-                elif filename and doc_filename == filename:
+            # file_id and filename are alternatives, so each is looked up on its own
+            for identifier in identifier_filters:
+                docs = await fetch_docs_filtered(vector_store, sosok, site, identifier)
+                for doc in docs:
+                    if doc.id in seen_ids:
+                        continue
+                    seen_ids.add(doc.id)
+                    meta = doc.meta or {}
                     ids_to_delete.append(doc.id)
-                    deleted_file_ids.add(doc_file_id)
+                    deleted_file_ids.add(meta.get("file_id", ""))
 
             if not ids_to_delete:
                 return {"status": "error", "message": "No documents matched the given identifier or permission denied."}
 
-            vector_store.delete_documents(document_ids=ids_to_delete)
+            await run_store_call(vector_store.delete_documents, document_ids=ids_to_delete)
 
-            upload_dir = "./uploads"
-            deleted_files = []
-            for fid in deleted_file_ids:
-                for f in os.listdir(upload_dir):
-                    if fid in f:
-                        try:
-                            os.remove(os.path.join(upload_dir, f))
-                            deleted_files.append(f)
-                            logging.info(f"🗑 Deleted file from disk: {f}")
-                        except Exception as e:
-                            logging.warning(f"⚠ Failed to delete uploaded file {f}: {e}")
+            deleted_files = await asyncio.to_thread(remove_uploaded_files, deleted_file_ids)
 
             return {
                 "status": "success",
@@ -316,10 +270,10 @@ def get_documents_router(vector_store):
         site: Optional[str] = Query(None)
     ):
         try:
-            loop = asyncio.get_event_loop()
-            docs = await loop.run_in_executor(None, lambda: vector_store.filter_documents(filters={}))
+            docs = await fetch_docs_filtered(vector_store, sosok, site)
 
-            # Filter documents by tags and permissions
+            # Filter documents by tags (permissions are applied by the store)
+            query_tags = set(tags)
             matched_file_ids = set()
             file_info = {}  # Store file information
 
@@ -327,18 +281,9 @@ def get_documents_router(vector_store):
                 meta = doc.meta or {}
                 file_id = meta.get("file_id", "")
 
-                # Check permission
-                if not check_document_access(meta, sosok, site):
-                    continue
+                doc_tags = get_doc_tags(meta)
 
-                raw_tags = meta.get("tags", [])
-                doc_tags = (
-                    [tag.strip() for tag in raw_tags.split(",") if tag.strip()]
-                    if isinstance(raw_tags, str)
-                    else [tag.strip() for tag in raw_tags if isinstance(tag, str)]
-                )
-
-                if all(tag in doc_tags for tag in tags):
+                if query_tags.issubset(doc_tags):
                     matched_file_ids.add(file_id)
                     # Store file information only once per file_id
                     if file_id not in file_info:
@@ -377,33 +322,20 @@ def get_documents_router(vector_store):
         site: Optional[str] = Query(None)
     ):
         try:
-            loop = asyncio.get_event_loop()
-            docs = await loop.run_in_executor(None, lambda: vector_store.filter_documents(filters={}))
-
-            def section_sort_key(title):
-                match = re.match(r'^(\d+(?:\.\d+)*)', title)
-                if not match:
-                    return []
-                return [int(part) for part in match.group(1).split(".")]
+            docs = await fetch_docs_filtered(
+                vector_store, sosok, site,
+                {"file_id": file_id, "page_number": page_number},
+                include_content=True
+            )
 
             matching_docs = []
             for doc in docs:
                 meta = doc.meta or {}
-                if (str(meta.get("file_id")) == str(file_id) and 
-                    str(meta.get("page_number")) == str(page_number)):
-                    # Check permission
-                    if check_document_access(meta, sosok, site):
-                        matching_docs.append({
-                            "title": meta.get("section_title", "제목 없음"),
-                            "content": doc.content,
-                            "section_id": meta.get("section_id", "")
-                        })
-
-            def section_sort_key(id_str):
-                match = re.match(r'^(\d+(?:\.\d+)*)', id_str)
-                if not match:
-                    return [999]
-                return [int(part) for part in match.group(1).split(".")]
+                matching_docs.append({
+                    "title": meta.get("section_title", "제목 없음"),
+                    "content": doc.content,
+                    "section_id": meta.get("section_id", "")
+                })
 
             matching_docs.sort(key=lambda d: section_sort_key(d["section_id"]))
 
@@ -423,25 +355,14 @@ def get_documents_router(vector_store):
     @router.get("/list-tags/")
     async def list_tags(sosok: Optional[str] = Query(None), site: Optional[str] = Query(None)):
         try:
-            loop = asyncio.get_event_loop()
-            docs = await loop.run_in_executor(None, lambda: vector_store.filter_documents(filters={}))
+            docs = await fetch_docs_filtered(vector_store, sosok, site)
 
             tag_set = set()
 
             for doc in docs:
                 meta = doc.meta or {}
-                
-                # Check permission
-                if not check_document_access(meta, sosok, site):
-                    continue
-
-                raw_tags = meta.get("tags", [])
-                tags = (
-                    [tag.strip() for tag in raw_tags.split(",") if tag.strip()]
-                    if isinstance(raw_tags, str)
-                    else [tag.strip() for tag in raw_tags if isinstance(tag, str)]
-                )
-                tag_set.update(tags)
+
+                tag_set.update(get_doc_tags(meta))
 
             return {"tags": sorted(tag_set)}
 
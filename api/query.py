@@ -7,42 +7,54 @@ class SimpleDocument:
         self.content = content
         self.meta = meta or {}
         self.id = meta.get('id') if meta else None
-from util.embedding import embed_query, cosine_similarity
-from llama_server_generator import LlamaServerGenerator
-import asyncio
-import traceback
-import json
+from util.embedding import embed_query, score_embeddings, top_k_distinct_indices
+from util.docstore import build_access_filters, get_doc_tags, normalize_scope, run_store_call
+from llama_server_generator import get_shared_generator
+import logging
+import orjson
 
 router = APIRouter()
 
-def check_document_access(doc_meta, sosok, site):
-    """Check if user has access to document based on sosok/site permissions"""
-    doc_sosok = doc_meta.get("sosok", "").strip()
-    doc_site = doc_meta.get("site", "").strip()
-    
-    # Admin access - can see everything
-    if sosok == "관리자" and site == "관리자":
-        return True
-    
-    # Must match sosok
-    if sosok and doc_sosok != sosok:
-        return False
-    
-    # Check site access
-    if site:
-        # Check for department-wide access (e.g., "레이더관제부_전체")
-        if site.endswith("_전체"):
-            dept_name = site[:-3]  # Remove "_전체"
-            # Need to check if this document belongs to the department
-            # This would require additional metadata or logic to determine department
-            # For now, we'll implement a simple check
-            return True  # Allow access to all sites in the department
-        else:
-            # Exact site match required
-            if doc_site != site:
-                return False
-    
-    return True
+# Constant parts of the answer prompt, built once; only the context and question vary per request
+_PROMPT_HEAD = """<|im_start|>system
+당신은 주어진 문서를 바탕으로 질문에 정확하고 상세하게 답변하는 한국어 AI 어시스턴트입니다.
+
+다음 규칙을 반드시 준수하세요:
+1. 문서에 없는 내용은 추측하지 말고, 문서에 기반한 사실만을 답변하세요.
+2. 질문과 관련된 내용을 최대한 원문 그대로 답변하세요.
+3. 이미지를 원문대로 포함해주세요.
+<|im_end|>
+<|im_start|>user
+다음 문서들을 참고하여 질문에 답변해주세요.
+
+### 참고 문서:
+"""
+_PROMPT_QUESTION = """
+
+### 질문:
+"""
+_PROMPT_TAIL = """
+<|im_end|>
+<|im_start|>assistant
+"""
+
+# Pre-encoded SSE framing; events are yielded as bytes so StreamingResponse skips re-encoding
+_SSE_PREFIX = b"data: "
+_SSE_SUFFIX = b"\n\n"
+_SSE_DONE = b"data: [DONE]\n\n"
+
+def sse_event(payload: dict) -> bytes:
+    """Encode one SSE data event"""
+    return _SSE_PREFIX + orjson.dumps(payload) + _SSE_SUFFIX
+
+def build_query_filters(sosok, site, doc_names=None):
+    """Permission filters plus an optional filename list for the query endpoints"""
+    filters = build_access_filters(sosok, site)
+    if doc_names:
+        # Deduplicated and normalized like the stored original_filename (strip + NFC);
+        # the store narrows its cached per-scope matrix to these names
+        filters["original_filename"] = sorted({normalize_scope(name) for name in doc_names})
+    return filters
 
 def get_query_router(vector_store, embedder):
     @router.get("/query-stream/")
@@ -70,69 +82,37 @@ def get_query_router(vector_store, embedder):
                 elif len(doc_names) == 1 and "," in doc_names[0]:
                     doc_names = [d.strip() for d in doc_names[0].split(",") if d.strip()]
 
-            loop = asyncio.get_event_loop()
-            all_docs = await loop.run_in_executor(None, lambda: vector_store.filter_documents(filters={}))
+            # Permission and filename filters are applied by the store; tags are checked here
+            filters = build_query_filters(sosok, site, doc_names)
+            all_docs, emb_matrix = await run_store_call(vector_store.get_embedding_matrix, filters=filters)
 
-            # Filter documents with enhanced permission check
-            filtered_docs = []
-            for doc in all_docs:
-                if not check_document_access(doc.meta or {}, sosok, site):
+            # Keep row indices so the embedding matrix can be sliced to the same documents
+            tags_set = frozenset(tag.strip() for tag in tags) if tags else None
+            keep = []
+            for i, doc in enumerate(all_docs):
+                if tags_set and not tags_set.issubset(get_doc_tags(doc.meta)):
                     continue
-                    
-                # Apply additional filters
-                if tags:
-                    tags_list = [tag.strip() for tag in tags]
-                    doc_tags = [t.strip() for t in doc.meta.get("tags", "").split(",")]
-                    if not all(tag in doc_tags for tag in tags_list):
-                        continue
-                        
-                if doc_names:
-                    doc_names_list = [name.strip() for name in doc_names]
-                    if doc.meta.get("original_filename", "").strip() not in doc_names_list:
-                        continue
                 
-                filtered_docs.append(doc)
+                keep.append(i)
+            filtered_docs = [all_docs[i] for i in keep]
 
             if not filtered_docs:
                 async def error_stream():
-                    error_data = json.dumps({"content": "⚠️ 관련 문서를 찾지 못했습니다."})
-                    yield f"data: {error_data}\n\n"
-                    yield "data: [DONE]\n\n"
+                    yield sse_event({"content": "⚠️ 관련 문서를 찾지 못했습니다."})
+                    yield _SSE_DONE
                 return StreamingResponse(error_stream(), media_type="text/event-stream")
 
-            scored_docs = []
-            for doc in filtered_docs:
-                if doc.embedding is not None and len(doc.embedding) > 0:
-                    score = cosine_similarity(doc.embedding, query_embedding)
-                    scored_docs.append((doc, score))
-
-            scored_docs.sort(key=lambda x: x[1], reverse=True)
-            top_docs = [doc for doc, _ in scored_docs[:top_n]]
-
-            context = "\n\n".join([doc.content for doc in top_docs if doc.content])
-            
-            prompt = f"""<|im_start|>system
-당신은 주어진 문서를 바탕으로 질문에 정확하고 상세하게 답변하는 한국어 AI 어시스턴트입니다.
-
-다음 규칙을 반드시 준수하세요:
-1. 문서에 없는 내용은 추측하지 말고, 문서에 기반한 사실만을 답변하세요.
-2. 질문과 관련된 내용을 최대한 원문 그대로 답변하세요.
-3. 이미지를 원문대로 포함해주세요.
-<|im_end|>
-<|im_start|>user
-다음 문서들을 참고하여 질문에 답변해주세요.
-
-### 참고 문서:
-{context}
+            # Score every candidate with a single matmul over the stacked embeddings
+            doc_matrix = emb_matrix if len(keep) == len(all_docs) else emb_matrix[keep]
+            scores = score_embeddings(doc_matrix, query_embedding)
+            top_idx = top_k_distinct_indices(scores, filtered_docs, top_n)
+            top_docs = [filtered_docs[i] for i in top_idx]
 
-### 질문:
-{user_query}
-<|im_end|>
-<|im_start|>assistant
-"""
+            context = "\n\n".join(doc.content for doc in top_docs if doc.content)
+            prompt = _PROMPT_HEAD + context + _PROMPT_QUESTION + user_query + _PROMPT_TAIL
             
-            # Use original LlamaServerGenerator without extra parameters
-            generator = LlamaServerGenerator(server_url="http://192.168.10.101:8080")
+            # Shared LlamaServerGenerator: requests reuse its kept-alive connections to the vLLM server
+            generator = get_shared_generator("http://192.168.10.101:8080")
             
             # Stream
             stream = generator.stream(
@@ -144,21 +124,19 @@ def get_query_router(vector_store, embedder):
             async def event_generator():
                 async for chunk in stream:
                     # JSON 형태로 청크를 래핑하여 전송
-                    json_chunk = json.dumps({"content": chunk})
-                    yield f"data: {json_chunk}\n\n"
+                    yield sse_event({"content": chunk})
                 # 스트림 종료 신호
-                yield "data: [DONE]\n\n"
+                yield _SSE_DONE
 
             return StreamingResponse(event_generator(), media_type="text/event-stream")
 
         except Exception as e:
-            traceback.print_exc()
+            logging.error(f"❌ Query failed: {e}", exc_info=True)
             error_message = f"⌒ 서버 오류 발생: {str(e)}"
 
             async def err_gen():
-                error_data = json.dumps({"error": error_message})
-                yield f"data: {error_data}\n\n"
-                yield "data: [DONE]\n\n"
+                yield sse_event({"error": error_message})
+                yield _SSE_DONE
 
             return StreamingResponse(err_gen(), media_type="text/event-stream")
 
@@ -191,45 +169,33 @@ def get_query_router(vector_store, embedder):
                     doc_names = [d.strip() for d in doc_names[0].split(",") if d.strip()]
             
             # Get and filter documents
-            loop = asyncio.get_event_loop()
-            all_docs = await loop.run_in_executor(None, lambda: vector_store.filter_documents(filters={}))
+            # Permission and filename filters are applied by the store; tags are checked here
+            filters = build_query_filters(sosok, site, doc_names)
+            all_docs, emb_matrix = await run_store_call(vector_store.get_embedding_matrix, filters=filters)
             
-            # Filter documents with enhanced permission check
-            filtered_docs = []
-            for doc in all_docs:
-                if not check_document_access(doc.meta or {}, sosok, site):
+            # Keep row indices so the embedding matrix can be sliced to the same documents
+            tags_set = frozenset(tag.strip() for tag in tags) if tags else None
+            keep = []
+            for i, doc in enumerate(all_docs):
+                if tags_set and not tags_set.issubset(get_doc_tags(doc.meta)):
                     continue
-                    
-                # Apply additional filters
-                if tags:
-                    tags_list = [tag.strip() for tag in tags]
-                    doc_tags = [t.strip() for t in doc.meta.get("tags", "").split(",")]
-                    if not all(tag in doc_tags for tag in tags_list):
-                        continue
-                        
-                if doc_names:
-                    doc_names_list = [name.strip() for name in doc_names]
-                    if doc.meta.get("original_filename", "").strip() not in doc_names_list:
-                        continue
                 
-                filtered_docs.append(doc)
+                keep.append(i)
+            filtered_docs = [all_docs[i] for i in keep]
             
             if not filtered_docs:
                 return {"documents": [], "message": "관련 문서를 찾지 못했습니다."}
             
-            # Score and sort documents
-            scored_docs = []
-            for doc in filtered_docs:
-                if doc.embedding is not None and len(doc.embedding) > 0:
-                    score = cosine_similarity(doc.embedding, query_embedding)
-                    scored_docs.append((doc, score))
-            
-            scored_docs.sort(key=lambda x: x[1], reverse=True)
-            top_docs = [doc for doc, score in scored_docs[:top_n]]
+            # Score every candidate with a single matmul over the stacked embeddings
+            doc_matrix = emb_matrix if len(keep) == len(all_docs) else emb_matrix[keep]
+            scores = score_embeddings(doc_matrix, query_embedding)
+            top_idx = top_k_distinct_indices(scores, filtered_docs, top_n)
             
             # Prepare document metadata
             documents = []
-            for doc, score in scored_docs[:top_n]:
+            for i in top_idx:
+                doc = filtered_docs[i]
+                score = float(scores[i])
                 meta = doc.meta or {}
                 documents.append({
                     "filename": meta.get("original_filename", "Unknown"),
@@ -252,7 +218,7 @@ def get_query_router(vector_store, embedder):
             }
             
         except Exception as e:
-            traceback.print_exc()
+            logging.error(f"❌ Document query failed: {e}", exc_info=True)
             raise HTTPException(status_code=500, detail=f"Document query failed: {str(e)}")
 
     return router
\ No newline at end of file
@@ -1,94 +1,119 @@
 from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import ORJSONResponse
 from typing import Optional, Dict, List
 from datetime import datetime, timedelta
 from collections import defaultdict, Counter
+from operator import itemgetter
 import logging
 import asyncio
+import functools
+import heapq
 import os
+import time
 import psutil
 import platform
 import socket
-import requests
-import subprocess
+import aiohttp
 import re
+try:
+    import pynvml
+except ImportError:
+    pynvml = None
+from util.docstore import DEPARTMENT_WIDE_SUFFIX, compile_access_predicate, is_admin, normalize_scope, run_store_call
 
-router = APIRouter()
+# Statistics payloads (tag/site breakdowns, recent uploads) are rendered with orjson
+router = APIRouter(default_response_class=ORJSONResponse)
 
-def check_document_access(doc_meta, sosok, site):
-    """Check if user has access to document based on sosok/site permissions"""
-    doc_sosok = doc_meta.get("sosok", "").strip()
-    doc_site = doc_meta.get("site", "").strip()
-    
-    # Admin access - can see everything
-    if sosok == "관리자" and site == "관리자":
-        return True
+# NVML handles are created once per process; _GPU_AVAILABLE flips to False on the first failure
+# so machines without an NVIDIA driver are not re-probed on every request
+_GPU_AVAILABLE = None
+_GPU_HANDLES = []
+
+def init_nvml():
+    """Initialize NVML and cache one handle per GPU (no-op after the first call)"""
+    global _GPU_AVAILABLE, _GPU_HANDLES
+    if _GPU_AVAILABLE is not None:
+        return _GPU_AVAILABLE
     
-    # Must match sosok
-    if sosok and doc_sosok != sosok:
+    if pynvml is None:
+        logging.info("pynvml not installed - GPU statistics disabled")
+        _GPU_AVAILABLE = False
         return False
     
-    # Check site access
-    if site:
-        # Check for department-wide access (e.g., "레이더관제부_전체")
-        if site.endswith("_전체"):
-            # Allow access to all sites in the same sosok
-            return True
-        else:
-            # Exact site match required
-            if doc_site != site:
-                return False
+    try:
+        pynvml.nvmlInit()
+        _GPU_HANDLES = [pynvml.nvmlDeviceGetHandleByIndex(i) for i in range(pynvml.nvmlDeviceGetCount())]
+        _GPU_AVAILABLE = True
+    except pynvml.NVMLError_LibraryNotFound:
+        logging.info("NVML library not found - no NVIDIA GPU detected")
+        _GPU_AVAILABLE = False
+    except pynvml.NVMLError as e:
+        logging.warning(f"NVML initialization failed: {e}")
+        _GPU_AVAILABLE = False
     
-    return True
+    return _GPU_AVAILABLE
+
+def _nvml_optional(func, *args):
+    """Call an NVML query that some GPUs don't support, returning None instead of raising"""
+    try:
+        return func(*args)
+    except pynvml.NVMLError:
+        return None
 
 def get_nvidia_gpu_info():
-    """Get NVIDIA GPU information using nvidia-smi"""
+    """Get NVIDIA GPU information from the cached NVML handles"""
     gpu_info = []
     
+    if not init_nvml():
+        return gpu_info
+    
     try:
-        # Check if nvidia-smi exists
-        result = subprocess.run(['nvidia-smi', '--query-gpu=index,name,memory.total,memory.used,memory.free,utilization.gpu,temperature.gpu,power.draw,power.limit', 
-                               '--format=csv,noheader,nounits'], 
-                               capture_output=True, text=True, timeout=5)
-        
-        if result.returncode == 0:
-            lines = result.stdout.strip().split('\n')
-            for line in lines:
-                if line.strip():
-                    parts = [p.strip() for p in line.split(',')]
-                    if len(parts) >= 9:
-                        gpu_info.append({
-                            'index': int(parts[0]),
-                            'name': parts[1],
-                            'memory': {
-                                'total': float(parts[2]),
-                                'used': float(parts[3]),
-                                'free': float(parts[4]),
-                                'percent': round((float(parts[3]) / float(parts[2])) * 100, 1) if float(parts[2]) > 0 else 0
-                            },
-                            'utilization': float(parts[5]),
-                            'temperature': float(parts[6]) if parts[6] != '[N/A]' else None,
-                            'power': {
-                                'draw': float(parts[7]) if parts[7] != '[N/A]' else None,
-                                'limit': float(parts[8]) if parts[8] != '[N/A]' else None
-                            }
-                        })
-    except FileNotFoundError:
-        # nvidia-smi not found
-        logging.info("nvidia-smi not found - no NVIDIA GPU detected")
-    except subprocess.TimeoutExpired:
-        logging.warning("nvidia-smi timeout")
+        for index, handle in enumerate(_GPU_HANDLES):
+            name = pynvml.nvmlDeviceGetName(handle)
+            if isinstance(name, bytes):
+                name = name.decode()
+            
+            # Same units nvidia-smi reports: MiB, %, °C, W
+            mem = pynvml.nvmlDeviceGetMemoryInfo(handle)
+            mem_total = mem.total / (1024 ** 2)
+            mem_used = mem.used / (1024 ** 2)
+            mem_free = mem.free / (1024 ** 2)
+            utilization = pynvml.nvmlDeviceGetUtilizationRates(handle)
+            temperature = _nvml_optional(pynvml.nvmlDeviceGetTemperature, handle, pynvml.NVML_TEMPERATURE_GPU)
+            power_draw = _nvml_optional(pynvml.nvmlDeviceGetPowerUsage, handle)
+            power_limit = _nvml_optional(pynvml.nvmlDeviceGetEnforcedPowerLimit, handle)
+            
+            gpu_info.append({
+                'index': index,
+                'name': name,
+                'memory': {
+                    'total': mem_total,
+                    'used': mem_used,
+                    'free': mem_free,
+                    'percent': round((mem_used / mem_total) * 100, 1) if mem_total > 0 else 0
+                },
+                'utilization': float(utilization.gpu),
+                'temperature': float(temperature) if temperature is not None else None,
+                'power': {
+                    'draw': power_draw / 1000 if power_draw is not None else None,
+                    'limit': power_limit / 1000 if power_limit is not None else None
+                }
+            })
     except Exception as e:
         logging.error(f"Error getting GPU info: {str(e)}")
     
     return gpu_info
 
+# Boot time is constant for the life of the process; read /proc/stat once
+BOOT_TIMESTAMP = psutil.boot_time()
+BOOT_TIME_ISO = datetime.fromtimestamp(BOOT_TIMESTAMP).isoformat()
+
 def get_uptime_string():
     """Get system uptime as a formatted string with days, hours, minutes, and seconds in Korean"""
-    boot_time = datetime.fromtimestamp(psutil.boot_time())
-    uptime = datetime.now() - boot_time
+    uptime_seconds = max(0, int(time.time() - BOOT_TIMESTAMP))
     
-    days = uptime.days
-    hours, remainder = divmod(uptime.seconds, 3600)
+    days, remainder = divmod(uptime_seconds, 86400)
+    hours, remainder = divmod(remainder, 3600)
     minutes, seconds = divmod(remainder, 60)
     
     # Format as "X일 X시간 X분 X초"
@@ -104,7 +129,389 @@ def get_uptime_string():
     
     return result.strip()
 
+# Server facts that don't change while the process runs, collected on first use
+_static_server_info = None
+
+def get_static_server_info():
+    """Hostname, platform and hardware totals (computed once per process)"""
+    global _static_server_info
+    if _static_server_info is None:
+        cpu_freq = psutil.cpu_freq()
+        hostname = socket.gethostname()
+        try:
+            ip_address = socket.gethostbyname(hostname)
+        except OSError:
+            # Unresolvable hostname (misconfigured /etc/hosts or DNS)
+            ip_address = "127.0.0.1"
+        _static_server_info = {
+            "hostname": hostname,
+            "ip_address": ip_address,
+            "platform": platform.system(),
+            "platform_version": platform.version(),
+            "processor": platform.processor(),
+            "python_version": platform.python_version(),
+            "cpu_count": psutil.cpu_count(),
+            "cpu_count_logical": psutil.cpu_count(logical=True),
+            "cpu_freq_max": round(cpu_freq.max, 2) if cpu_freq else 0,
+            "disk_total": psutil.disk_usage('/').total
+        }
+    return _static_server_info
+
+# Dynamic readings are reused for DYNAMIC_STATS_TTL seconds so the dashboard can poll freely
+DYNAMIC_STATS_TTL = 1.0
+CPU_SAMPLE_INTERVAL = 1.0
+_dynamic_cache = {"ts": 0.0, "data": None}
+_cpu_percent = 0.0
+
+async def _sample_cpu_percent():
+    """Background sampler: non-blocking cpu_percent over each CPU_SAMPLE_INTERVAL window"""
+    global _cpu_percent
+    psutil.cpu_percent(interval=None)  # first call only sets the baseline
+    while True:
+        await asyncio.sleep(CPU_SAMPLE_INTERVAL)
+        _cpu_percent = psutil.cpu_percent(interval=None)
+
+# The web server is probed in the background; the endpoint only reads the last result
+WEB_SERVER_URL = os.environ.get('WEB_SERVER_URL', 'http://localhost')
+WEB_PROBE_INTERVAL = 10
+WEB_PROBE_TIMEOUT = 2
+_web_status = {"url": WEB_SERVER_URL, "status": "unknown", "response_time": None, "status_code": None}
+
+async def _probe_web_server(session):
+    """Check the web server once and return its status, status code and response time (ms)"""
+    status = {"url": WEB_SERVER_URL, "status": "unknown", "response_time": None, "status_code": None}
+    loop = asyncio.get_running_loop()
+    try:
+        start_time = loop.time()
+        async with session.get(WEB_SERVER_URL) as response:
+            status["status"] = 'online' if response.status == 200 else 'error'
+            status["status_code"] = response.status
+            status["response_time"] = int((loop.time() - start_time) * 1000)  # milliseconds
+    except asyncio.TimeoutError:
+        status["status"] = 'timeout'
+    except aiohttp.ClientConnectionError:
+        status["status"] = 'offline'
+    except Exception as e:
+        status["status"] = 'error'
+        status["error"] = str(e)
+    return status
+
+async def _probe_web_server_loop():
+    """Background prober: refresh _web_status every WEB_PROBE_INTERVAL seconds"""
+    global _web_status
+    timeout = aiohttp.ClientTimeout(total=WEB_PROBE_TIMEOUT)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        while True:
+            _web_status = await _probe_web_server(session)
+            await asyncio.sleep(WEB_PROBE_INTERVAL)
+
+# Running background tasks by name; a finished task removes itself so the next start_background_tasks restarts it
+_background_tasks: Dict[str, asyncio.Task] = {}
+
+def _forget_background_task(name, task):
+    if _background_tasks.get(name) is task:
+        del _background_tasks[name]
+    if not task.cancelled() and task.exception() is not None:
+        logging.warning(f"⚠️ Statistics background task {name} stopped: {task.exception()}")
+
+def start_background_tasks(vector_store):
+    """Start whichever statistics background tasks aren't running (needs a running event loop)"""
+    loops = {
+        "cpu": _sample_cpu_percent,
+        "statistics": lambda: _refresh_statistics_loop(vector_store),
+        "web": _probe_web_server_loop,
+    }
+    for name, make_loop in loops.items():
+        if name in _background_tasks:
+            continue
+        task = asyncio.create_task(make_loop())
+        _background_tasks[name] = task
+        task.add_done_callback(functools.partial(_forget_background_task, name))
+
+async def stop_background_tasks():
+    """Cancel the statistics background tasks and wait for them to finish (application shutdown)"""
+    tasks = list(_background_tasks.values())
+    _background_tasks.clear()
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+def get_dynamic_server_info():
+    """CPU, memory, disk, network and GPU readings, cached for DYNAMIC_STATS_TTL seconds"""
+    now = time.monotonic()
+    if _dynamic_cache["data"] is not None and now - _dynamic_cache["ts"] < DYNAMIC_STATS_TTL:
+        return _dynamic_cache["data"]
+    
+    # One snapshot per probe; every field below is read from these
+    static = get_static_server_info()
+    memory = psutil.virtual_memory()
+    disk = psutil.disk_usage('/')
+    net = psutil.net_io_counters()
+    cpu_freq = psutil.cpu_freq()
+    data = {
+        "cpu": {
+            "count": static["cpu_count"],
+            "count_logical": static["cpu_count_logical"],
+            "percent": _cpu_percent,
+            "freq_current": round(cpu_freq.current, 2) if cpu_freq else 0,
+            "freq_max": static["cpu_freq_max"]
+        },
+        "memory": {
+            "total": memory.total,
+            "available": memory.available,
+            "used": memory.used,
+            "percent": memory.percent,
+            "total_gb": round(memory.total / (1024**3), 2),
+            "used_gb": round(memory.used / (1024**3), 2),
+            "available_gb": round(memory.available / (1024**3), 2)
+        },
+        "disk": {
+            "total": static["disk_total"],
+            "used": disk.used,
+            "free": disk.free,
+            "percent": disk.percent,
+            "total_gb": round(static["disk_total"] / (1024**3), 2),
+            "used_gb": round(disk.used / (1024**3), 2),
+            "free_gb": round(disk.free / (1024**3), 2)
+        },
+        "network": {
+            "bytes_sent": net.bytes_sent,
+            "bytes_recv": net.bytes_recv,
+            "packets_sent": net.packets_sent,
+            "packets_recv": net.packets_recv,
+            "bytes_sent_mb": round(net.bytes_sent / (1024**2), 2),
+            "bytes_recv_mb": round(net.bytes_recv / (1024**2), 2)
+        },
+        "gpu_devices": get_nvidia_gpu_info()
+    }
+    _dynamic_cache["ts"] = now
+    _dynamic_cache["data"] = data
+    return data
+
+# Document statistics are aggregated per (sosok, site) by a background refresher, so requests
+# merge a handful of pre-built groups instead of scanning every section in the collection
+STATS_REFRESH_INTERVAL = 30
+STATS_PAYLOAD_FIELDS = [
+    "doc_id", "file_id", "sosok", "site", "tags", "original_filename", "total_pdf_pages", "upload_date"
+]
+_stats_groups = None
+_stats_generation = None  # store write generation the current aggregates were built from
+_stats_lock = asyncio.Lock()
+
+# Upload days are handled as YYYYMMDD ints; no datetime is built per section
+_DATE_RE = re.compile(r'\d{8}')
+
+# Stored upload names are "<uuid4 hex>_<original name>"
+_UUID_PREFIX_RE = re.compile(r'[a-f0-9]{32}_')
+
+def strip_uuid_prefix(filename):
+    """Remove the 32-character hex prefix + underscore from filename if present"""
+    # Cheap length/separator check first; the regex only runs on names that can match
+    if len(filename) > 32 and filename[32] == '_' and _UUID_PREFIX_RE.match(filename):
+        return filename[33:]
+    return filename
+
+def scan_upload_storage(upload_dir="./uploads"):
+    """Total size, file count and size per extension of the upload dir (one scandir pass, one stat per file)"""
+    total_size = 0
+    file_count = 0
+    size_by_type = Counter()
+    try:
+        with os.scandir(upload_dir) as entries:
+            for entry in entries:
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+                file_size = entry.stat().st_size
+                total_size += file_size
+                file_count += 1
+                
+                # Get file extension (a leading dot alone doesn't make one, as with os.path.splitext)
+                stem, dot, ext = entry.name.lower().rpartition('.')
+                if dot and ext and stem.strip('.'):
+                    size_by_type[ext] += file_size
+    except FileNotFoundError:
+        pass
+    return total_size, file_count, size_by_type
+
+def _extract_file_info(meta, doc_id, default_date):
+    """
+    Per-file entry (type, owner, upload date, tags) taken from the file's first section
+    The upload date is best-effort: document ID, then metadata, then default_date (today)
+    """
+    filename = meta.get("original_filename", "")
+    
+    clean_filename = strip_uuid_prefix(filename)
+    ext = os.path.splitext(clean_filename.lower())[-1].lstrip('.')
+    
+    # Extract date from document ID more reliably
+    upload_date = ""
+    if doc_id:
+        # Try to extract date from the ID
+        # Assuming ID format like "20240315_..." or contains date
+        date_match = _DATE_RE.search(doc_id)
+        if date_match:
+            upload_date = date_match.group()
+    
+    # If no date in ID, try to get from metadata or use current date
+    if not upload_date:
+        upload_date = meta.get("upload_date") or default_date
+    
+    return {
+        "filename": clean_filename,  # Use cleaned filename
+        "ext": ext,
+        "upload_date": upload_date,
+        "tags": meta.get("tags", ""),
+        "sosok": meta.get("sosok", "Unknown"),
+        "site": meta.get("site", "Unknown"),
+        "total_pages": meta.get("total_pdf_pages", 0)
+    }
+
+def _parse_yyyymmdd(value):
+    """"YYYYMMDD" string -> int such as 20240315, or None if it isn't a plausible date"""
+    if not isinstance(value, str) or len(value) != 8 or not (value.isascii() and value.isdigit()):
+        return None
+    month, day = int(value[4:6]), int(value[6:8])
+    if 1 <= month <= 12 and 1 <= day <= 31:
+        return int(value)
+    return None
+
+def _extract_upload_day(meta, doc_id):
+    """Upload day of a section as a YYYYMMDD int (from its document ID or metadata), or None"""
+    upload_day = None
+    if doc_id:
+        date_match = _DATE_RE.search(doc_id)
+        if date_match:
+            upload_day = _parse_yyyymmdd(date_match.group())
+    
+    # Try metadata if ID extraction failed
+    if upload_day is None:
+        upload_day = _parse_yyyymmdd(meta.get("upload_date"))
+    
+    return upload_day
+
+def build_statistics_groups(payloads):
+    """Aggregate section payloads into per-(sosok, site) statistics groups (blocking; run in an executor)"""
+    # Hot loop over every section: per-group containers and helpers are bound to locals
+    # so each iteration does plain local lookups instead of nested dict subscripts
+    groups = {}
+    section_counts = Counter()
+    today = datetime.now().strftime("%Y%m%d")
+    extract_file_info = _extract_file_info
+    extract_upload_day = _extract_upload_day
+    
+    for meta in payloads:
+        meta_get = meta.get
+        key = (meta_get("sosok", ""), meta_get("site", ""))
+        section_counts[key] += 1
+        group = groups.get(key)
+        if group is None:
+            # file_id -> info from its first section, tags counted once per section, YYYYMMDD int -> file_ids
+            group = groups[key] = ({}, Counter(), defaultdict(set))
+        files, tag_counter, uploads_by_date = group
+        
+        doc_id = meta_get("doc_id") or ""
+        file_id = meta_get("file_id", "")
+        if file_id and file_id not in files:
+            files[file_id] = extract_file_info(meta, doc_id, today)
+        
+        tags_str = meta_get("tags", "")
+        if tags_str:
+            tag_counter.update(t.strip() for t in tags_str.split(",") if t.strip())
+        
+        if file_id:
+            upload_day = extract_upload_day(meta, doc_id)
+            if upload_day:
+                uploads_by_date[upload_day].add(file_id)
+    
+    return {
+        key: {
+            "sections": section_counts[key],
+            "files": files,
+            "tag_counter": tag_counter,
+            # A file belongs to exactly one (sosok, site) group, so per-group counts can be summed
+            # across groups later; the file_id sets are only needed while building
+            "uploads_by_date": {day: len(file_ids) for day, file_ids in uploads_by_date.items()}
+        }
+        for key, (files, tag_counter, uploads_by_date) in groups.items()
+    }
+
+async def refresh_statistics_groups(vector_store):
+    """Re-read section metadata (no content, no vectors) and rebuild the aggregates"""
+    global _stats_groups, _stats_generation
+    # Read before the scroll: a write landing during the scroll leaves the generation stale and forces another rebuild
+    generation = vector_store.write_generation
+    payloads = await run_store_call(vector_store.scroll_payloads, STATS_PAYLOAD_FIELDS)
+    _stats_groups = await asyncio.to_thread(build_statistics_groups, payloads)
+    _stats_generation = generation
+    return _stats_groups
+
+async def _refresh_statistics_loop(vector_store):
+    """Background refresher: every STATS_REFRESH_INTERVAL seconds, rebuild the aggregates if the store was written to"""
+    while True:
+        await asyncio.sleep(STATS_REFRESH_INTERVAL)
+        if _stats_groups is None or vector_store.write_generation == _stats_generation:
+            continue  # nobody has asked for statistics yet, or nothing changed since the last build
+        try:
+            await refresh_statistics_groups(vector_store)
+        except Exception as e:
+            logging.warning(f"⚠️ Statistics refresh failed: {e}")
+
+async def get_statistics_groups(vector_store):
+    """Current aggregates; the first request builds them inline, later ones reuse the background copy"""
+    start_background_tasks(vector_store)
+    if _stats_groups is None:
+        async with _stats_lock:
+            if _stats_groups is None:
+                await refresh_statistics_groups(vector_store)
+    return _stats_groups
+
+def select_stats_groups(groups, sosok, site, admin):
+    """Groups the caller may see; a group shares one sosok/site, so access is checked once per group"""
+    if admin:
+        return list(groups.values())
+    can_access = compile_access_predicate(sosok, site)
+    return [
+        group for (doc_sosok, doc_site), group in groups.items()
+        if can_access({"sosok": doc_sosok, "site": doc_site})
+    ]
+
+# The process sweep touches every PID on the host, so it runs in a worker thread and is reused briefly
+PROCESS_STATS_TTL = 3.0
+TOP_PROCESS_COUNT = 10
+_process_cache = {"ts": 0.0, "data": None}
+
+def _sample_top_processes():
+    """Top processes by CPU usage among those using > 1% CPU or > 100MB RSS (blocking)"""
+    processes = []
+    for proc in psutil.process_iter(['pid', 'name', 'cpu_percent', 'memory_info']):
+        try:
+            pinfo = proc.info
+            if pinfo['cpu_percent'] > 1 or pinfo['memory_info'].rss > 100 * 1024 * 1024:  # CPU > 1% or Memory > 100MB
+                processes.append({
+                    'pid': pinfo['pid'],
+                    'name': pinfo['name'],
+                    'cpu_percent': round(pinfo['cpu_percent'], 2),
+                    'memory_mb': round(pinfo['memory_info'].rss / (1024**2), 2)
+                })
+        except:
+            pass
+    
+    # Top 10 by CPU usage without sorting the whole list
+    return heapq.nlargest(TOP_PROCESS_COUNT, processes, key=itemgetter('cpu_percent'))
+
+async def get_top_processes():
+    """Top processes, sampled off the event loop and cached for PROCESS_STATS_TTL seconds"""
+    if _process_cache["data"] is not None and time.monotonic() - _process_cache["ts"] < PROCESS_STATS_TTL:
+        return _process_cache["data"]
+    
+    data = await asyncio.to_thread(_sample_top_processes)
+    _process_cache["ts"] = time.monotonic()
+    _process_cache["data"] = data
+    return data
+
 def get_statistics_router(vector_store):
+    init_nvml()
+    get_static_server_info()  # resolve hostname/platform now rather than on the first request
     
     @router.get("/statistics/")
     async def get_statistics(
@@ -113,27 +520,20 @@ def get_statistics_router(vector_store):
     ):
         """Get comprehensive statistics for documents"""
         try:
-            loop = asyncio.get_event_loop()
-            docs = await loop.run_in_executor(None, lambda: vector_store.filter_documents(filters={}))
-            
-            # Filter by permissions
-            filtered_docs = []
-            for doc in docs:
-                meta = doc.meta or {}
-                if check_document_access(meta, sosok, site):
-                    filtered_docs.append(doc)
+            admin = is_admin(sosok, site)
+            groups = select_stats_groups(await get_statistics_groups(vector_store), sosok, site, admin)
             
             # Initialize statistics
             stats = {
                 "total_documents": 0,
-                "total_sections": len(filtered_docs),
+                "total_sections": sum(group["sections"] for group in groups),
                 "total_size": 0,
-                "documents_by_type": defaultdict(int),
-                "documents_by_sosok": defaultdict(int),
-                "documents_by_site": defaultdict(int),
+                "documents_by_type": Counter(),
+                "documents_by_sosok": Counter(),
+                "documents_by_site": Counter(),
                 "popular_tags": [],
                 "recent_uploads": [],
-                "uploads_by_date": defaultdict(int),
+                "uploads_by_date": Counter(),
                 "average_sections_per_document": 0,
                 "total_users": 0,
                 "file_sizes": [],
@@ -141,100 +541,26 @@ def get_statistics_router(vector_store):
             }
             
             # Set access level
-            if sosok == "관리자" and site == "관리자":
+            if admin:
                 stats["access_level"] = "admin"
-            elif site and site.endswith("_전체"):
+            elif site and normalize_scope(site).endswith(DEPARTMENT_WIDE_SUFFIX):
                 stats["access_level"] = "department"
             
-            # Track unique documents and users
-            unique_files = set()
-            unique_users = set()
+            # Merge the pre-aggregated groups the caller can see
             file_info = {}
             tag_counter = Counter()
+            for group in groups:
+                file_info.update(group["files"])
+                tag_counter.update(group["tag_counter"])
             
-            # Process documents
-            for doc in filtered_docs:
-                meta = doc.meta or {}
-                file_id = meta.get("file_id", "")
-                
-                if file_id and file_id not in unique_files:
-                    unique_files.add(file_id)
-                    
-                    # Document type
-                    filename = meta.get("original_filename", "")
-                    
-                    # Remove UUID prefix from filename if present
-                    # Pattern: 32-character hex string followed by underscore
-                    import re
-                    clean_filename = re.sub(r'^[a-f0-9]{32}_', '', filename)
-                    
-                    ext = os.path.splitext(clean_filename.lower())[-1].lstrip('.')
-                    if ext:
-                        stats["documents_by_type"][ext] += 1
-                    
-                    # Sosok and Site
-                    doc_sosok = meta.get("sosok", "Unknown")
-                    doc_site = meta.get("site", "Unknown")
-                    if doc_sosok:
-                        stats["documents_by_sosok"][doc_sosok] += 1
-                    if doc_site:
-                        stats["documents_by_site"][doc_site] += 1
-                    
-                    # Store file info for recent uploads
-                    # Extract date from document ID more reliably
-                    upload_date = ""
-                    if doc.id:
-                        # Try to extract date from the ID
-                        # Assuming ID format like "20240315_..." or contains date
-                        import re
-                        date_match = re.search(r'(\d{8})', doc.id)
-                        if date_match:
-                            upload_date = date_match.group(1)
-                        elif len(doc.id) >= 8 and doc.id[:8].isdigit():
-                            upload_date = doc.id[:8]
-                    
-                    # If no date in ID, try to get from metadata or use current date
-                    if not upload_date and meta.get("upload_date"):
-                        upload_date = meta.get("upload_date")
-                    elif not upload_date:
-                        # Try to get file creation time from disk
-                        try:
-                            upload_dir = "./uploads"
-                            if file_id and os.path.exists(upload_dir):
-                                for filename in os.listdir(upload_dir):
-                                    if file_id in filename:
-                                        filepath = os.path.join(upload_dir, filename)
-                                        file_stat = os.stat(filepath)
-                                        # Use file creation time (or modification time as fallback)
-                                        timestamp = file_stat.st_birthtime if hasattr(file_stat, 'st_birthtime') else file_stat.st_mtime
-                                        from datetime import datetime
-                                        upload_date = datetime.fromtimestamp(timestamp).strftime("%Y%m%d")
-                                        break
-                        except:
-                            pass
-                        
-                        # Final fallback - use current date
-                        if not upload_date:
-                            from datetime import datetime
-                            upload_date = datetime.now().strftime("%Y%m%d")
-                    
-                    file_info[file_id] = {
-                        "filename": clean_filename,  # Use cleaned filename
-                        "upload_date": upload_date,
-                        "tags": meta.get("tags", ""),
-                        "sosok": doc_sosok,
-                        "site": doc_site,
-                        "total_pages": meta.get("total_pdf_pages", 0)
-                    }
-                
-                # Tags
-                tags_str = meta.get("tags", "")
-                if tags_str:
-                    tags = [t.strip() for t in tags_str.split(",") if t.strip()]
-                    tag_counter.update(tags)
+            # Counter.update counts a whole iterable in C instead of one Python-level += per file
+            files = file_info.values()
+            stats["documents_by_type"].update(info["ext"] for info in files if info["ext"])
+            stats["documents_by_sosok"].update(info["sosok"] for info in files if info["sosok"])
+            stats["documents_by_site"].update(info["site"] for info in files if info["site"])
             
             # Calculate statistics
-            stats["total_documents"] = len(unique_files)
+            stats["total_documents"] = len(file_info)
             
             # Popular tags (top 10)
             stats["popular_tags"] = [
@@ -242,12 +568,12 @@ def get_statistics_router(vector_store):
                 for tag, count in tag_counter.most_common(10)
             ]
             
-            # Recent uploads (last 10)
-            sorted_files = sorted(
-                file_info.items(), 
-                key=lambda x: x[1]["upload_date"], 
-                reverse=True
-            )[:10]
+            # Recent uploads (last 10) - a 10-element heap instead of sorting every file
+            sorted_files = heapq.nlargest(
+                10,
+                file_info.items(),
+                key=lambda x: x[1]["upload_date"]
+            )
             
             stats["recent_uploads"] = [
                 {
@@ -267,12 +593,7 @@ def get_statistics_router(vector_store):
                     stats["total_sections"] / stats["total_documents"], 1
                 )
             
-            # Convert defaultdicts to regular dicts for JSON serialization
-            stats["documents_by_type"] = dict(stats["documents_by_type"])
-            stats["documents_by_sosok"] = dict(stats["documents_by_sosok"])
-            stats["documents_by_site"] = dict(stats["documents_by_site"])
-            stats["uploads_by_date"] = dict(stats["uploads_by_date"])
-            
+            # Counters are dicts, so they serialize as-is
             return stats
             
         except Exception as e:
@@ -288,22 +609,16 @@ def get_statistics_router(vector_store):
     ):
         """Get upload statistics by date for chart visualization"""
         try:
-            loop = asyncio.get_event_loop()
-            docs = await loop.run_in_executor(None, lambda: vector_store.filter_documents(filters={}))
-            
-            # Filter by permissions
-            filtered_docs = []
-            for doc in docs:
-                meta = doc.meta or {}
-                if check_document_access(meta, sosok, site):
-                    filtered_docs.append(doc)
+            admin = is_admin(sosok, site)
+            groups = select_stats_groups(await get_statistics_groups(vector_store), sosok, site, admin)
             
             # Track uploads by date
-            uploads_by_date = defaultdict(set)  # date -> set of file_ids
+            uploads_by_date = Counter()  # YYYYMMDD int -> unique documents
             
             # Get current date
             today = datetime.now()
             start_date = today - timedelta(days=days)
+            start_day = int(start_date.strftime("%Y%m%d"))
             
             # Initialize all dates with 0
             date_counts = {}
@@ -313,42 +628,16 @@ def get_statistics_router(vector_store):
                 date_counts[date_str] = 0
             
             # Count unique documents per day
-            for doc in filtered_docs:
-                meta = doc.meta or {}
-                file_id = meta.get("file_id", "")
-                
-                # Extract date from document ID or metadata
-                upload_date = None
-                if doc.id and len(doc.id) >= 8:
-                    try:
-                        # Try multiple date extraction methods
-                        import re
-                        date_match = re.search(r'(\d{8})', doc.id)
-                        if date_match:
-                            date_str = date_match.group(1)
-                            doc_date = datetime.strptime(date_str, "%Y%m%d")
-                            upload_date = doc_date
-                        elif doc.id[:8].isdigit():
-                            doc_date = datetime.strptime(doc.id[:8], "%Y%m%d")
-                            upload_date = doc_date
-                    except:
-                        pass
-                
-                # Try metadata if ID extraction failed
-                if not upload_date and meta.get("upload_date"):
-                    try:
-                        upload_date = datetime.strptime(meta["upload_date"], "%Y%m%d")
-                    except:
-                        pass
-                
-                if upload_date and upload_date >= start_date and file_id:
-                    formatted_date = upload_date.strftime("%Y-%m-%d")
-                    uploads_by_date[formatted_date].add(file_id)
+            for group in groups:
+                for upload_day, count in group["uploads_by_date"].items():
+                    if upload_day >= start_day:
+                        uploads_by_date[upload_day] += count
             
-            # Convert sets to counts
-            for date, file_ids in uploads_by_date.items():
+            # Only the surviving buckets are formatted as "%Y-%m-%d"
+            for upload_day, count in uploads_by_date.items():
+                date = f"{upload_day // 10000:04d}-{upload_day // 100 % 100:02d}-{upload_day % 100:02d}"
                 if date in date_counts:
-                    date_counts[date] = len(file_ids)
+                    date_counts[date] = count
             
             # Prepare data for chart
             sorted_dates = sorted(date_counts.keys())
@@ -357,7 +646,7 @@ def get_statistics_router(vector_store):
                 "dates": sorted_dates,
                 "counts": [date_counts[date] for date in sorted_dates],
                 "total": sum(date_counts.values()),
-                "access_level": "admin" if (sosok == "관리자" and site == "관리자") else "normal"
+                "access_level": "admin" if admin else "normal"
             }
             
         except Exception as e:
@@ -373,25 +662,9 @@ def get_statistics_router(vector_store):
         """Get storage statistics for uploaded files"""
         try:
             # Admin users can see all storage stats
-            if sosok == "관리자" and site == "관리자":
+            if is_admin(sosok, site):
                 # Show all storage stats
-                upload_dir = "./uploads"
-                total_size = 0
-                file_count = 0
-                size_by_type = defaultdict(int)
-                
-                if os.path.exists(upload_dir):
-                    for filename in os.listdir(upload_dir):
-                        filepath = os.path.join(upload_dir, filename)
-                        if os.path.isfile(filepath):
-                            file_size = os.path.getsize(filepath)
-                            total_size += file_size
-                            file_count += 1
-                            
-                            # Get file extension
-                            ext = os.path.splitext(filename.lower())[-1].lstrip('.')
-                            if ext:
-                                size_by_type[ext] += file_size
+                total_size, file_count, size_by_type = await asyncio.to_thread(scan_upload_storage)
                 
                 return {
                     "total_size": total_size,
@@ -426,57 +699,40 @@ def get_statistics_router(vector_store):
         """Get server monitoring statistics"""
         try:
             # Admin users can see server stats
-            if sosok == "관리자" and site == "관리자":
+            if is_admin(sosok, site):
+                start_background_tasks(vector_store)
+                static = get_static_server_info()
+                
+                # System probes, process sweep and Qdrant counts are independent - run them concurrently
+                # Vector Store statistics with unique document count (counted by Qdrant, no payload transfer)
+                dynamic, top_processes, total_vectors, unique_documents = await asyncio.gather(
+                    asyncio.to_thread(get_dynamic_server_info),
+                    get_top_processes(),
+                    run_store_call(vector_store.count_documents),
+                    run_store_call(vector_store.count_unique, "file_id")
+                )
+                
                 # AI Server (current server) statistics
                 ai_server = {
                     "name": "AI Server",
-                    "hostname": socket.gethostname(),
-                    "ip_address": socket.gethostbyname(socket.gethostname()),
+                    "hostname": static["hostname"],
+                    "ip_address": static["ip_address"],
                     "status": "online",
-                    "platform": platform.system(),
-                    "platform_version": platform.version(),
-                    "processor": platform.processor(),
-                    "python_version": platform.python_version(),
-                    "cpu": {
-                        "count": psutil.cpu_count(),
-                        "count_logical": psutil.cpu_count(logical=True),
-                        "percent": psutil.cpu_percent(interval=1),
-                        "freq_current": round(psutil.cpu_freq().current, 2) if psutil.cpu_freq() else 0,
-                        "freq_max": round(psutil.cpu_freq().max, 2) if psutil.cpu_freq() else 0
-                    },
-                    "memory": {
-                        "total": psutil.virtual_memory().total,
-                        "available": psutil.virtual_memory().available,
-                        "used": psutil.virtual_memory().used,
-                        "percent": psutil.virtual_memory().percent,
-                        "total_gb": round(psutil.virtual_memory().total / (1024**3), 2),
-                        "used_gb": round(psutil.virtual_memory().used / (1024**3), 2),
-                        "available_gb": round(psutil.virtual_memory().available / (1024**3), 2)
-                    },
-                    "disk": {
-                        "total": psutil.disk_usage('/').total,
-                        "used": psutil.disk_usage('/').used,
-                        "free": psutil.disk_usage('/').free,
-                        "percent": psutil.disk_usage('/').percent,
-                        "total_gb": round(psutil.disk_usage('/').total / (1024**3), 2),
-                        "used_gb": round(psutil.disk_usage('/').used / (1024**3), 2),
-                        "free_gb": round(psutil.disk_usage('/').free / (1024**3), 2)
-                    },
-                    "network": {
-                        "bytes_sent": psutil.net_io_counters().bytes_sent,
-                        "bytes_recv": psutil.net_io_counters().bytes_recv,
-                        "packets_sent": psutil.net_io_counters().packets_sent,
-                        "packets_recv": psutil.net_io_counters().packets_recv,
-                        "bytes_sent_mb": round(psutil.net_io_counters().bytes_sent / (1024**2), 2),
-                        "bytes_recv_mb": round(psutil.net_io_counters().bytes_recv / (1024**2), 2)
-                    },
+                    "platform": static["platform"],
+                    "platform_version": static["platform_version"],
+                    "processor": static["processor"],
+                    "python_version": static["python_version"],
+                    "cpu": dynamic["cpu"],
+                    "memory": dynamic["memory"],
+                    "disk": dynamic["disk"],
+                    "network": dynamic["network"],
                     "uptime": get_uptime_string(),
-                    "boot_time": datetime.fromtimestamp(psutil.boot_time()).isoformat(),
+                    "boot_time": BOOT_TIME_ISO,
                     "current_time": datetime.now().isoformat()
                 }
                 
                 # Add GPU information
-                gpu_info = get_nvidia_gpu_info()
+                gpu_info = dynamic["gpu_devices"]
                 if gpu_info:
                     ai_server["gpu"] = {
                         "available": True,
@@ -491,61 +747,10 @@ def get_statistics_router(vector_store):
                     }
                 
                 # Process information
-                processes = []
-                for proc in psutil.process_iter(['pid', 'name', 'cpu_percent', 'memory_info']):
-                    try:
-                        pinfo = proc.info
-                        if pinfo['cpu_percent'] > 1 or pinfo['memory_info'].rss > 100 * 1024 * 1024:  # CPU > 1% or Memory > 100MB
-                            processes.append({
-                                'pid': pinfo['pid'],
-                                'name': pinfo['name'],
-                                'cpu_percent': round(pinfo['cpu_percent'], 2),
-                                'memory_mb': round(pinfo['memory_info'].rss / (1024**2), 2)
-                            })
-                    except:
-                        pass
-                
-                # Sort by CPU usage
-                processes.sort(key=lambda x: x['cpu_percent'], reverse=True)
-                ai_server['top_processes'] = processes[:10]  # Top 10 processes
-                
-                # WEB Server statistics (external check)
-                web_server = {
-                    "name": "WEB Server",
-                    "url": "http://localhost",  # Update with actual web server URL
-                    "status": "unknown",
-                    "response_time": None,
-                    "status_code": None
-                }
-                
-                # Try to check web server status
-                try:
-                    web_server_url = os.environ.get('WEB_SERVER_URL', 'http://localhost')
-                    start_time = datetime.now()
-                    response = requests.get(web_server_url, timeout=5)
-                    end_time = datetime.now()
-                    
-                    web_server['url'] = web_server_url
-                    web_server['status'] = 'online' if response.status_code == 200 else 'error'
-                    web_server['status_code'] = response.status_code
-                    web_server['response_time'] = int((end_time - start_time).total_seconds() * 1000)  # milliseconds
-                except requests.exceptions.Timeout:
-                    web_server['status'] = 'timeout'
-                except requests.exceptions.ConnectionError:
-                    web_server['status'] = 'offline'
-                except Exception as e:
-                    web_server['status'] = 'error'
-                    web_server['error'] = str(e)
-                
-                # Vector Store statistics with unique document count
-                loop = asyncio.get_event_loop()
-                all_docs = await loop.run_in_executor(None, lambda: vector_store.filter_documents(filters={}))
+                ai_server['top_processes'] = top_processes
                 
-                # Count unique documents by file_id
-                unique_doc_ids = set()
-                for doc in all_docs:
-                    if doc.meta and doc.meta.get("file_id"):
-                        unique_doc_ids.add(doc.meta["file_id"])
+                # WEB Server statistics (last result of the background probe)
+                web_server = {"name": "WEB Server", **_web_status}
                 
                 # Determine vector store type from vector_store class name
                 store_type = type(vector_store).__name__
@@ -562,12 +767,12 @@ def get_statistics_router(vector_store):
                 else:
                     vector_type = store_type
                 
-                vector_store = {
+                vector_store_info = {
                     "name": "Vector Store",
                     "type": vector_type,
-                    "total_vectors": len(all_docs),  # Total number of vectors (sections)
-                    "unique_documents": len(unique_doc_ids),  # Number of unique documents
-                    "document_count": len(unique_doc_ids),  # For backward compatibility
+                    "total_vectors": total_vectors,  # Total number of vectors (sections)
+                    "unique_documents": unique_documents,  # Number of unique documents
+                    "document_count": unique_documents,  # For backward compatibility
                     "status": "online"
                 }
                 
@@ -576,14 +781,14 @@ def get_statistics_router(vector_store):
                     try:
                         # Try to get collection info
                         if hasattr(vector_store, 'collection_name'):
-                            vector_store['collection'] = vector_store.collection_name
+                            vector_store_info['collection'] = vector_store.collection_name
                     except:
                         pass
                 
                 return {
                     "ai_server": ai_server,
                     "web_server": web_server,
-                    "vector_store": vector_store,
+                    "vector_store": vector_store_info,
                     "access_level": "admin"
                 }
             else:
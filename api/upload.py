@@ -6,21 +6,171 @@ class SimpleDocument:
         self.content = content
         self.meta = meta or {}
         self.id = meta.get('id') if meta else None
-import os, shutil, uuid, unicodedata, logging, gc
-import pdfplumber
-import asyncio, re
-import json
+import os, uuid, unicodedata, logging, time, hashlib
+import fitz  # PyMuPDF
+import asyncio, re, functools, multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import orjson
 from decimal import Decimal
 from util.pdf import split_pdf_by_section_headings, split_pdf_by_token_window
 from util.embedding import embed_document_sections
 from util.docx import split_docx_by_section_headings, split_docx_by_token_window
 from util.pptx import split_pptx_by_section_headings, split_pptx_by_token_window
-from util.hwpx import parse_hwpx_content_with_page
+from util.hwpx import parse_hwpx_content_with_page, split_hwpx_by_pages
+from util.tokenizer import get_tokenizer
+from util.docstore import WriteBatcher, run_store_call
 UPLOAD_DIR = "./uploads"
+TOKENIZER_MODEL = "./models/KURE-v1"
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1 MiB copy buffer bounds per-upload memory
+MAINTENANCE_DOC_PREFIX = "유지보수교범"
+MAINTENANCE_SCAN_PAGES = 3  # pages checked for the maintenance title before giving up
+MAINTENANCE_TITLE_CHARS = 200  # leading characters of a page searched for its first line
+_WHITESPACE_RE = re.compile(r"\s+")
+# Files parsed/embedded at once across all upload requests, so a large batch can't flood the executor
+UPLOAD_CONCURRENCY = int(os.getenv("HAYSTACK_UPLOAD_CONCURRENCY", str(os.cpu_count() or 4)))
+_upload_semaphore = asyncio.Semaphore(UPLOAD_CONCURRENCY)
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
+# PDF splitting is CPU-bound Python (pdfplumber); worker processes parse in parallel, each with its own GIL
+PDF_WORKERS = int(os.getenv("HAYSTACK_PDF_WORKERS", str(os.cpu_count() or 2)))
+_pdf_pool = None
+
+def get_pdf_pool():
+    """Process pool for PDF splitting, created on first use ("spawn": workers inherit no CUDA state or threads)"""
+    global _pdf_pool
+    if _pdf_pool is None:
+        _pdf_pool = ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pdf_pool
+
+def shutdown_pdf_pool():
+    """Stop the PDF worker processes, letting running splits finish (blocking; called on application shutdown)"""
+    global _pdf_pool
+    pool, _pdf_pool = _pdf_pool, None
+    if pool is not None:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+@functools.lru_cache(maxsize=1024)
+def normalize_filename(filename):
+    """Stripped + NFC form of an uploaded filename; the one key used for metadata and per-file settings"""
+    return unicodedata.normalize("NFC", filename.strip())
+
+def normalize_filename_keys(mapping):
+    """Re-key a per-file settings dict by normalized filename (non-dict JSON is treated as empty)"""
+    if not isinstance(mapping, dict):
+        return {}
+    return {normalize_filename(name): value for name, value in mapping.items()}
+
+def save_upload_file(upload_file, file_path):
+    """
+    Stream an UploadFile to disk in fixed-size chunks (blocking; run in an executor)
+    Returns the blake2b digest of the content, hashed while the chunks are copied
+    """
+    content_hash = hashlib.blake2b(digest_size=16)
+    source = upload_file.file
+    with open(file_path, "wb") as buffer:
+        while chunk := source.read(UPLOAD_CHUNK_SIZE):
+            content_hash.update(chunk)
+            buffer.write(chunk)
+    source.close()
+    return content_hash.hexdigest()
+
+def remove_upload_file(file_path):
+    """Delete a processed upload from disk, logging instead of raising on failure"""
+    try:
+        os.remove(file_path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logging.warning(f"⚠️ Failed to delete uploaded file {file_path}: {e}")
+
+def inspect_pdf(path):
+    """Open the PDF once and return (is_maintenance_doc, total_pages)"""
+    # MuPDF reads the page count from the xref and extracts text in C; pdfplumber stays for splitting
+    with fitz.open(path) as pdf:
+        total_pages = pdf.page_count
+        # Only the first few pages can carry the title line; image-only PDFs aren't scanned to the end
+        for page_index in range(min(total_pages, MAINTENANCE_SCAN_PAGES)):
+            text = pdf.load_page(page_index).get_text("text", sort=True).lstrip()
+            if text:
+                # Only the first line matters; don't strip/split the rest of the page
+                first_line = text[:MAINTENANCE_TITLE_CHARS].partition("\n")[0]
+                cleaned = _WHITESPACE_RE.sub("", first_line)
+                return cleaned.startswith(MAINTENANCE_DOC_PREFIX), total_pages
+    return False, total_pages
+
+# Parsers take (loop, file_path, file_id, document_title, top_margin, bottom_margin) and return (sections, total_pages)
+async def _parse_pdf(loop, file_path, file_id, document_title, top_margin, bottom_margin):
+    is_maintenance_pdf, total_pages = await loop.run_in_executor(None, inspect_pdf, file_path)
+
+    if is_maintenance_pdf:
+        # Pass document title as the last parameter
+        sections = await loop.run_in_executor(
+            get_pdf_pool(),
+            functools.partial(
+                split_pdf_by_section_headings,
+                file_path,
+                None,
+                top_margin,
+                bottom_margin,
+                doc_id=None,
+                extract_text_tables=True,
+                auto_detect_header_footer=True,
+                document_title=document_title
+            )
+        )
+    else:
+        sections = await loop.run_in_executor(
+            get_pdf_pool(),
+            split_pdf_by_token_window,
+            file_path,
+            top_margin,
+            bottom_margin,
+            700,
+            100,
+            TOKENIZER_MODEL,
+            None,  # doc_id
+            True,  # extract_text_tables
+            True   # auto_detect_header_footer
+        )
+    return sections, total_pages
+
+async def _parse_hwpx(loop, file_path, file_id, document_title, top_margin, bottom_margin):
+    sections = await loop.run_in_executor(None, split_hwpx_by_pages, file_path, file_id)
+    total_pages = max((s.get("page_number", 0) for s in sections), default=1)
+    return sections, total_pages
+
+async def _parse_docx(loop, file_path, file_id, document_title, top_margin, bottom_margin):
+    sections = await loop.run_in_executor(
+        None, split_docx_by_token_window, file_path, 700, 100, get_tokenizer(TOKENIZER_MODEL)
+    )
+    return sections, len(sections)
+
+async def _parse_pptx(loop, file_path, file_id, document_title, top_margin, bottom_margin):
+    sections = await loop.run_in_executor(
+        None, split_pptx_by_token_window, file_path, 700, 100, get_tokenizer(TOKENIZER_MODEL)
+    )
+    return sections, len(sections)
+
+_PARSERS = {
+    ".pdf": _parse_pdf,
+    ".hwpx": _parse_hwpx,
+    ".docx": _parse_docx,
+    ".pptx": _parse_pptx,
+}
+
+_EMPTY_SECTIONS_MESSAGES = {
+    ".pdf": "PDF에서 추출된 페이지가 없습니다.",
+    ".hwpx": "HWPX 문서에서 추출된 내용이 없습니다.",
+    ".docx": "DOCX 문서에서 추출된 내용이 없습니다.",
+    ".pptx": "PPTX 문서에서 추출된 내용이 없습니다."
+}
+
 def get_upload_router(vector_store, embedder):
     router = APIRouter()
+    # Sections from concurrently processed files are stored in shared bulk writes
+    write_batcher = WriteBatcher(vector_store)
+    # Load the DOCX/PPTX chunking tokenizer at startup; uploads then hit the cache
+    get_tokenizer(TOKENIZER_MODEL)
 
     @router.post("/upload-pdf/")
     async def upload_pdf(
@@ -34,45 +184,49 @@ def get_upload_router(vector_store, embedder):
         margin_settings: Optional[str] = Form(None),  # JSON string with per-file margins
         overwrite_decisions: Optional[str] = Form(None)  # JSON string with overwrite decisions
     ):
-        results = []
-        
         # Normalize sosok and site values - CRITICAL: must match documents.py logic exactly
-        sosok = sosok.strip() if sosok else ""
-        site = site.strip() if site else ""
+        # Stored values are final (stripped + NFC) so readers never re-normalize per document
+        sosok = unicodedata.normalize("NFC", sosok.strip()) if sosok else ""
+        site = unicodedata.normalize("NFC", site.strip()) if site else ""
         
         logging.info(f"📥 Upload request - sosok: '{sosok}', site: '{site}', files: {len(files)}")
         
         # Parse margin settings if provided
+        # Keys are normalized like the filenames they are looked up with, once per request
         margin_map = {}
         if margin_settings:
             try:
-                margin_data = json.loads(margin_settings)
-                margin_map = margin_data
+                margin_data = orjson.loads(margin_settings)
+                margin_map = normalize_filename_keys(margin_data)
                 logging.info(f"📐 Margin settings: {margin_map}")
-            except json.JSONDecodeError:
+            except orjson.JSONDecodeError:
                 logging.warning("Failed to parse margin_settings JSON")
         
         # Parse overwrite decisions if provided
         overwrite_map = {}
         if overwrite_decisions:
             try:
-                overwrite_map = json.loads(overwrite_decisions)
+                overwrite_map = normalize_filename_keys(orjson.loads(overwrite_decisions))
                 logging.info(f"📝 Overwrite decisions: {overwrite_map}")
-            except json.JSONDecodeError:
+            except orjson.JSONDecodeError:
                 logging.warning("Failed to parse overwrite_decisions JSON")
 
-        for idx, file in enumerate(files):
+        loop = asyncio.get_running_loop()
+
+        async def process_file(file):
+            """Save, split, embed and store a single uploaded file; returns its result entry"""
             embedded_docs = []
+            file_path = None
+            # Computed before the try so every result, including the error path, reports the same name
+            normalized_filename = normalize_filename(file.filename)
             try:
-                normalized_filename = unicodedata.normalize("NFC", file.filename.strip())
                 ext = os.path.splitext(file.filename.lower())[-1]
-                if ext not in [".pdf", ".hwpx", ".docx", ".pptx"]:
-                    results.append({
+                if ext not in _PARSERS:
+                    return {
                         "status": "실패",
                         "message": "PDF, HWPX, DOCX, PPTX 파일만 지원됩니다.",
                         "original_filename": normalized_filename
-                    })
-                    continue
+                    }
 
                 # Check for overwrite decision (just for logging)
                 overwrite_action = overwrite_map.get(normalized_filename, None)
@@ -85,7 +239,6 @@ def get_upload_router(vector_store, embedder):
                 
                 # If keep-both is selected, add timestamp to filename
                 if overwrite_action == "keep-both":
-                    import time
                     timestamp = int(time.time())
                     name_parts = normalized_filename.rsplit('.', 1)
                     if len(name_parts) == 2:
@@ -95,150 +248,79 @@ def get_upload_router(vector_store, embedder):
                 
                 file_path = os.path.join(UPLOAD_DIR, unique_filename)
 
-                with open(file_path, "wb") as buffer:
-                    shutil.copyfileobj(file.file, buffer, length=8192)
-                file.file.close()
+                content_sha = await loop.run_in_executor(None, save_upload_file, file, file_path)
+
+                # Byte-identical file already stored for this site: skip parse/embed/write entirely
+                if overwrite_action != "overwrite":
+                    duplicate_count = await run_store_call(
+                        vector_store.count_documents,
+                        {"content_sha": content_sha, "sosok": sosok, "site": site}
+                    )
+                    if duplicate_count:
+                        logging.info(f"⏭ Skipping duplicate content for: {normalized_filename}")
+                        return {
+                            "status": "성공",
+                            "message": "중복 (스킵됨)",
+                            "original_filename": normalized_filename,
+                            "skipped_duplicate": True
+                        }
 
                 # Get margins for this specific file
-                file_margins = margin_map.get(file.filename, {})
+                file_margins = margin_map.get(normalized_filename, {})
                 file_top_margin = Decimal(file_margins.get("top_margin", str(top_margin)))
                 file_bottom_margin = Decimal(file_margins.get("bottom_margin", str(bottom_margin)))
 
-                loop = asyncio.get_event_loop()
-                if ext == ".pdf":
-                    def detect_maintenance_doc(path):
-                        with pdfplumber.open(path) as pdf:
-                            for page in pdf.pages:
-                                text = page.extract_text()
-                                if text:
-                                    first_line = text.strip().splitlines()[0]
-                                    cleaned = re.sub(r"\\s+", "", first_line)
-                                    return cleaned.startswith("유지보수교범")
-                        return False
-
-                    is_maintenance_pdf = await loop.run_in_executor(None, detect_maintenance_doc, file_path)
-
-                    if is_maintenance_pdf:
-                        # Pass document title as the last parameter
-                        sections = await loop.run_in_executor(
-                            None,
-                            lambda: split_pdf_by_section_headings(
-                                file_path,
-                                None,
-                                file_top_margin,
-                                file_bottom_margin,
-                                doc_id=None,
-                                extract_text_tables=True,
-                                auto_detect_header_footer=True,
-                                document_title=normalized_filename
-                            )
-                        )
-                    else:
-                        sections = await loop.run_in_executor(
-                            None,
-                            split_pdf_by_token_window,
-                            file_path,
-                            file_top_margin,
-                            file_bottom_margin,
-                            700,
-                            100,
-                            "./models/KURE-v1",
-                            None,  # doc_id
-                            True,  # extract_text_tables
-                            True   # auto_detect_header_footer
-                        )
-
-                    def get_total_pages(path):
-                        with pdfplumber.open(path) as pdf:
-                            return len(pdf.pages)
-                    total_pages = await loop.run_in_executor(None, get_total_pages, file_path)
-
-                elif ext == ".hwpx":
-                    from util.hwpx import split_hwpx_by_pages
-                    sections = await loop.run_in_executor(None, split_hwpx_by_pages, file_path, unique_filename)
-                    total_pages = max([s.get("page_number", 0) for s in sections]) if sections else 1
-
-                elif ext == ".docx":
-                    from transformers import AutoTokenizer
-                    tokenizer = AutoTokenizer.from_pretrained("./models/KURE-v1")
-                    sections = await loop.run_in_executor(
-                        None,
-                        split_docx_by_token_window,
-                        file_path,
-                        700,
-                        100,
-                        tokenizer
-                    )
-                    total_pages = len(sections)
-
-                elif ext == ".pptx":
-                    from transformers import AutoTokenizer
-                    tokenizer = AutoTokenizer.from_pretrained("./models/KURE-v1")
-                    sections = await loop.run_in_executor(
-                        None,
-                        split_pptx_by_token_window,
-                        file_path,
-                        700,
-                        100,
-                        tokenizer
-                    )
-                    total_pages = len(sections)
+                parse = _PARSERS[ext]
+                sections, total_pages = await parse(
+                    loop, file_path, unique_filename, normalized_filename, file_top_margin, file_bottom_margin
+                )
 
                 if not sections:
-                    fail_msg = {
-                        ".pdf": "PDF에서 추출된 페이지가 없습니다.",
-                        ".hwpx": "HWPX 문서에서 추출된 내용이 없습니다.",
-                        ".docx": "DOCX 문서에서 추출된 내용이 없습니다.",
-                        ".pptx": "PPTX 문서에서 추출된 내용이 없습니다."
-                    }.get(ext, "문서에서 추출된 내용이 없습니다.")
-
-                    results.append({
+                    fail_msg = _EMPTY_SECTIONS_MESSAGES.get(ext, "문서에서 추출된 내용이 없습니다.")
+
+                    return {
                         "status": "실패",
                         "message": fail_msg,
                         "original_filename": normalized_filename
-                    })
-                    continue
+                    }
 
                 # CRITICAL: metadata must match exactly what documents.py expects
+                tags_list = [tag.strip() for tag in tags.split(",") if tag.strip()] if tags else []
                 metadata_base = {
                     "original_filename": normalized_filename,
-                    "tags": ", ".join([tag.strip() for tag in tags.split(",") if tag.strip()]) if tags else "",
-                    "sosok": sosok,  # Already normalized with strip()
-                    "site": site,    # Already normalized with strip()
+                    "tags": ", ".join(tags_list),
+                    "tags_list": tags_list,  # pre-parsed so readers don't re-split "tags"
+                    "sosok": sosok,  # Already normalized with strip() + NFC
+                    "site": site,    # Already normalized with strip() + NFC
                     "file_id": unique_filename,
+                    "content_sha": content_sha,  # blake2b of the uploaded bytes, for duplicate detection
                     "total_pdf_pages": total_pages
                 }
 
                 logging.info(f"📝 Metadata for new document: filename='{metadata_base['original_filename']}', sosok='{metadata_base['sosok']}', site='{metadata_base['site']}'")
 
-                embedded_docs = embed_document_sections(sections, metadata_base, total_pages, embedder)
-
-                # Filter invalid docs
-                embedded_docs = [doc for doc in embedded_docs if doc.embedding is not None and len(doc.embedding) > 0]
+                embedded_docs = await loop.run_in_executor(
+                    None, embed_document_sections, sections, metadata_base, total_pages, embedder
+                )
 
+                # embed_document_sections only returns docs with valid (finite, non-zero) embeddings
                 if embedded_docs:
                     logging.info(f"📌 Saving {len(embedded_docs)} embedded documents for: {normalized_filename}")
-                    vector_store.write_documents(embedded_docs)
+                    await write_batcher.write(embedded_docs)
                     
                 else:
                     logging.warning(f"⚠ No valid embedded documents to write for: {normalized_filename}")
-                    results.append({
+                    return {
                         "status": "실패",
                         "message": "임베딩된 문서가 없어서 저장되지 않았습니다.",
                         "original_filename": normalized_filename
-                    })
-                    continue
-
-                try:
-                    os.remove(file_path)
-                except OSError as e:
-                    logging.warning(f"⚠️ Failed to delete uploaded file {file_path}: {e}")
+                    }
 
                 # Prepare result with overwrite status
                 result_item = {
                     "status": "성공",
                     "message": f"{ext.upper()[1:]} 파일 임베딩 후 저장됨",
-                    "original_filename": file.filename,
+                    "original_filename": normalized_filename,
                     "num_pages": len(embedded_docs),
                     "total_pdf_pages": total_pages
                 }
@@ -251,21 +333,27 @@ def get_upload_router(vector_store, embedder):
                     result_item["kept_both"] = True
                     result_item["message"] = f"{ext.upper()[1:]} 파일 중복 저장됨"
                 
-                results.append(result_item)
-
-                del embedded_docs
-                gc.collect()
+                return result_item
 
             except Exception as e:
-                logging.error(f"❌ Error processing file {file.filename}: {str(e)}")
-                import traceback
-                traceback.print_exc()
-                results.append({
+                logging.error(f"❌ Error processing file {normalized_filename}: {str(e)}", exc_info=True)
+                return {
                     "status": "실패",
                     "message": f"처리 중 오류 발생: {str(e)}",
-                    "original_filename": file.filename,
+                    "original_filename": normalized_filename,
                     "num_pages": len(embedded_docs) if isinstance(embedded_docs, list) else 0
-                })
+                }
+            finally:
+                # Clean up the uploaded copy on every exit path without waiting on the disk
+                if file_path is not None:
+                    loop.run_in_executor(None, remove_upload_file, file_path)
+
+        async def process_file_bounded(file):
+            async with _upload_semaphore:
+                return await process_file(file)
+
+        # Files are independent, so save/split/embed them concurrently (bounded by UPLOAD_CONCURRENCY)
+        results = await asyncio.gather(*(process_file_bounded(file) for file in files))
 
         logging.info(f"📊 Upload complete. Processed {len(files)} files with {len(results)} results")
         return {"results": results}
@@ -1,12 +1,29 @@
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Query
-from typing import Dict, Set
+from typing import Dict, Optional, Set
 import asyncio
 import logging
-import json
+import orjson
 from task_manager_sqlite import task_manager
 
 router = APIRouter()
 
+# 이벤트 루프는 태스크를 약한 참조로만 보관하므로, 완료될 때까지 강한 참조를 유지
+_background_tasks: Set[asyncio.Task] = set()
+
+def _spawn(coro) -> asyncio.Task:
+    """Schedule a notification coroutine without letting the task be garbage-collected"""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+def encode_message(message: dict) -> str:
+    """orjson으로 한 번만 직렬화 - 브라우저가 JSON.parse 할 수 있도록 텍스트 프레임용 str 반환"""
+    return orjson.dumps(message).decode()
+
+async def send_message(websocket: WebSocket, message: dict):
+    await websocket.send_text(encode_message(message))
+
 class ConnectionManager:
     def __init__(self):
         # sosok_site를 키로 하는 WebSocket 연결 관리
@@ -34,23 +51,33 @@ class ConnectionManager:
     async def send_to_site(self, sosok: str, site: str, message: dict):
         """특정 현장의 모든 연결에 메시지 전송"""
         key = f"{sosok}_{site}"
+        # 락은 연결 목록 스냅샷에만 사용 - 느린 클라이언트가 다른 현장의 전송을 막지 않도록
         async with self.lock:
-            if key in self.active_connections:
-                # 연결이 끊긴 소켓 추적
-                disconnected = set()
-                for connection in self.active_connections[key]:
-                    try:
-                        await connection.send_json(message)
-                    except:
-                        disconnected.add(connection)
-                
-                # 끊긴 연결 제거
-                for conn in disconnected:
-                    self.active_connections[key].discard(conn)
+            connections = list(self.active_connections.get(key, ()))
+        if not connections:
+            return
+        
+        # 메시지는 한 번만 직렬화하고 모든 연결에 동시에 전송, 실패한 소켓은 연결이 끊긴 것으로 간주
+        payload = encode_message(message)
+        results = await asyncio.gather(
+            *(connection.send_text(payload) for connection in connections),
+            return_exceptions=True
+        )
+        disconnected = [conn for conn, result in zip(connections, results) if isinstance(result, BaseException)]
+        
+        # 끊긴 연결 제거
+        if disconnected:
+            async with self.lock:
+                active = self.active_connections.get(key)
+                if active is not None:
+                    active.difference_update(disconnected)
+                    if not active:
+                        del self.active_connections[key]
     
-    async def broadcast_task_update(self, task_id: str):
-        """작업 업데이트를 해당 현장에 브로드캐스트"""
-        task = task_manager.get_task(task_id)
+    async def broadcast_task_update(self, task_id: str, task: Optional[dict] = None):
+        """작업 업데이트를 해당 현장에 브로드캐스트 (이미 조회한 task가 있으면 재조회하지 않음)"""
+        if task is None:
+            task = task_manager.get_task(task_id)
         if task:
             # 해당 현장의 모든 작업 목록 전송
             tasks = task_manager.get_tasks_by_site(task["sosok"], task["site"])
@@ -66,6 +93,55 @@ class ConnectionManager:
 
 manager = ConnectionManager()
 
+# 상태 변경 알림을 짧은 시간 동안 모아서 현장별로 한 번만 조회/전송
+NOTIFY_DEBOUNCE_SECONDS = 0.1
+
+class TaskUpdateNotifier:
+    """Coalesce task update notifications: one task-list query and broadcast per site per debounce window"""
+    
+    def __init__(self, delay: float = NOTIFY_DEBOUNCE_SECONDS):
+        self.delay = delay
+        self._pending: Dict[str, None] = {}  # 순서를 유지하는 task_id 집합
+        self._handle: Optional[asyncio.TimerHandle] = None
+    
+    def schedule(self, task_id: str):
+        """Mark a task as updated; the first call in a window arms the flush timer"""
+        self._pending[task_id] = None
+        if self._handle is None:
+            self._handle = asyncio.get_running_loop().call_later(self.delay, self._start_flush)
+    
+    def _start_flush(self):
+        self._handle = None
+        task_ids = list(self._pending)
+        self._pending.clear()
+        _spawn(self._flush(task_ids))
+    
+    async def _flush(self, task_ids):
+        # 업데이트된 작업을 현장별로 묶기
+        updated_by_site: Dict[tuple, list] = {}
+        for task_id in task_ids:
+            task = task_manager.get_task(task_id)
+            if task:
+                updated_by_site.setdefault((task["sosok"], task["site"]), []).append(task_id)
+        
+        for (sosok, site), site_task_ids in updated_by_site.items():
+            try:
+                tasks = task_manager.get_tasks_by_site(sosok, site)
+                await manager.send_to_site(
+                    sosok,
+                    site,
+                    {
+                        "type": "task_update",
+                        "tasks": tasks,
+                        "updated_task_id": site_task_ids[-1],
+                        "updated_task_ids": site_task_ids
+                    }
+                )
+            except Exception as e:
+                logging.error(f"❌ Failed to notify task update: {e}")
+
+notifier = TaskUpdateNotifier()
+
 @router.websocket("/ws")
 async def websocket_endpoint(
     websocket: WebSocket,
@@ -77,7 +153,7 @@ async def websocket_endpoint(
     try:
         # 연결 시 현재 작업 목록 전송
         tasks = task_manager.get_tasks_by_site(sosok, site)
-        await websocket.send_json({
+        await send_message(websocket, {
             "type": "initial_tasks",
             "tasks": tasks
         })
@@ -90,16 +166,16 @@ async def websocket_endpoint(
                 
                 # 클라이언트에서 보낸 메시지 처리
                 try:
-                    data = json.loads(message)
+                    data = orjson.loads(message)
                     
                     # ping 메시지에 대한 pong 응답
                     if data.get("type") == "ping":
-                        await websocket.send_json({"type": "pong"})
+                        await send_message(websocket, {"type": "pong"})
                     
                     # 작업 목록 새로고침 요청
                     elif data.get("type") == "refresh":
                         tasks = task_manager.get_tasks_by_site(sosok, site)
-                        await websocket.send_json({
+                        await send_message(websocket, {
                             "type": "task_update",
                             "tasks": tasks
                         })
@@ -111,7 +187,7 @@ async def websocket_endpoint(
                             task_manager.dismiss_task(task_id)
                             # 업데이트된 목록 전송
                             tasks = task_manager.get_tasks_by_site(sosok, site)
-                            await websocket.send_json({
+                            await send_message(websocket, {
                                 "type": "task_update",
                                 "tasks": tasks
                             })
@@ -121,12 +197,12 @@ async def websocket_endpoint(
                         task_manager.dismiss_completed_tasks(sosok, site)
                         # 업데이트된 목록 전송
                         tasks = task_manager.get_tasks_by_site(sosok, site)
-                        await websocket.send_json({
+                        await send_message(websocket, {
                             "type": "task_update",
                             "tasks": tasks
                         })
                         
-                except json.JSONDecodeError:
+                except orjson.JSONDecodeError:
                     pass  # 잘못된 JSON 무시
                     
             except asyncio.TimeoutError:
@@ -136,14 +212,14 @@ async def websocket_endpoint(
                 # 변경사항이 있는 경우에만 전송
                 active_tasks = [t for t in tasks if t["status"] in ["uploading", "queued", "processing"]]
                 if active_tasks:
-                    await websocket.send_json({
+                    await send_message(websocket, {
                         "type": "task_update",
                         "tasks": tasks
                     })
                 
                 # 연결 확인용 ping
                 try:
-                    await websocket.send_json({"type": "ping"})
+                    await send_message(websocket, {"type": "ping"})
                 except:
                     break  # 연결이 끊긴 경우
     
@@ -172,18 +248,18 @@ def setup_task_notifications():
     
     def update_with_notification(task_id: str, *args, **kwargs):
         result = original_update(task_id, *args, **kwargs)
-        asyncio.create_task(notify_task_update(task_id))
+        notifier.schedule(task_id)
         return result
     
     def complete_with_notification(task_id: str, *args, **kwargs):
         result = original_complete(task_id, *args, **kwargs)
-        asyncio.create_task(notify_task_update(task_id))
+        notifier.schedule(task_id)
         return result
     
     def fail_with_notification(task_id: str, *args, **kwargs):
         result = original_fail(task_id, *args, **kwargs)
-        # 실패 시 즉시 알림 (사용자가 바로 확인할 수 있도록)
-        asyncio.create_task(notify_task_update(task_id))
+        # 실패도 같은 창(0.1초)으로 묶어서 알림 - 사용자 입장에서는 즉시 표시됨
+        notifier.schedule(task_id)
         return result
     
     def dismiss_with_notification(task_id: str):
@@ -191,13 +267,13 @@ def setup_task_notifications():
         task = task_manager.get_task(task_id)
         result = original_dismiss(task_id)
         if task:
-            asyncio.create_task(manager.broadcast_task_update(task_id))
+            _spawn(manager.broadcast_task_update(task_id, task))
         return result
     
     def dismiss_all_with_notification(sosok: str, site: str):
         result = original_dismiss_all(sosok, site)
         # 임시 task_id로 브로드캐스트 (전체 목록 갱신)
-        asyncio.create_task(async_broadcast_site_update(sosok, site))
+        _spawn(async_broadcast_site_update(sosok, site))
         return result
     
     task_manager.update_task_status = update_with_notification
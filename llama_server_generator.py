@@ -1,16 +1,91 @@
 from typing import AsyncGenerator, Optional, List, Dict, Any
 import httpx
-import json
+import orjson
 import logging
+import re
+import time
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_SERVER_URL = "http://192.168.10.101:8080"
+DEFAULT_MODEL = "/models/A.X-3.1-Light"
+# Long generations stream for minutes; connect stays generous for a cold vLLM server
+DEFAULT_TIMEOUT = httpx.Timeout(timeout=600.0, read=600.0, connect=300.0)
+# Kept-alive connections to the vLLM server, reused across requests
+DEFAULT_LIMITS = httpx.Limits(max_keepalive_connections=32, max_connections=64)
+
+# One <|im_start|>role ... <|im_end|> turn; content may not run into the next turn's <|im_start|>
+_CHAT_TURN_RE = re.compile(
+    r"<\|im_start\|>(system|user|assistant)((?:(?!<\|im_start\|>).)*?)<\|im_end\|>",
+    re.DOTALL
+)
+
+# Streamed deltas are merged until this many are pending or this much time has passed since the last yield
+STREAM_COALESCE_CHUNKS = 32
+STREAM_COALESCE_SECONDS = 0.03
+
+_JSON_HEADERS = {"Content-Type": "application/json"}
+_SSE_DATA_PREFIX = b"data: "
+_SSE_DONE = b"[DONE]"
+
+
+async def _iter_sse_data(response: httpx.Response) -> AsyncGenerator[bytes, None]:
+    """Yield the payload of each `data: ` line of an SSE response as raw bytes, stopping at [DONE]"""
+    buffer = bytearray()
+    async for chunk in response.aiter_bytes():
+        buffer += chunk
+        start = 0
+        # 완성된 줄만 처리하고, 잘린 마지막 줄은 다음 청크와 합쳐질 때까지 버퍼에 남김
+        while (newline := buffer.find(b"\n", start)) != -1:
+            line = bytes(buffer[start:newline]).rstrip(b"\r")
+            start = newline + 1
+            if line.startswith(_SSE_DATA_PREFIX):
+                data = line[len(_SSE_DATA_PREFIX):]
+                if data == _SSE_DONE:
+                    return
+                yield data
+        del buffer[:start]
+
+
+class _JsonObjectScanner:
+    """
+    Incremental completeness check for streamed tool-call arguments
+    Tracks bracket depth and string/escape state across deltas, so each character is scanned once
+    """
+    
+    def __init__(self):
+        self.depth = 0
+        self.started = False
+        self.in_string = False
+        self.escape = False
+    
+    def feed(self, text: str) -> bool:
+        """Scan a new delta; True once the top-level object/array has been closed"""
+        for char in text:
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif char == "\\":
+                    self.escape = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char in "{[":
+                self.depth += 1
+                self.started = True
+            elif char in "}]":
+                self.depth -= 1
+                if self.started and self.depth == 0:
+                    return True
+        return False
+
 
 class LlamaServerGenerator:
     """OpenAI-compatible vLLM server generator with streaming and tool use support"""
     
     def __init__(self, 
-                 server_url: str = "http://192.168.10.101:8080",
+                 server_url: str = DEFAULT_SERVER_URL,
                  default_max_tokens: int = 10000):
         """
         Initialize the LlamaServerGenerator
@@ -26,8 +101,17 @@ class LlamaServerGenerator:
         self.completion_url = f"{server_url}/v1/completions"
         self.chat_url = f"{server_url}/v1/chat/completions"
         
-        # 기본 생성 파라미터 설정
+        # 기본 생성 파라미터 설정 (요청마다 복사해서 사용)
         self.default_max_tokens = default_max_tokens
+        self._default_params = {"max_tokens": default_max_tokens}
+        self.model = DEFAULT_MODEL  # 모델 경로
+        
+        # 요청마다 새 연결을 맺지 않도록 keep-alive 커넥션 풀을 인스턴스 전체에서 공유
+        self._client = httpx.AsyncClient(timeout=DEFAULT_TIMEOUT, limits=DEFAULT_LIMITS)
+    
+    async def aclose(self):
+        """Close the pooled HTTP connections (call on application shutdown)"""
+        await self._client.aclose()
         
     async def stream(self, 
                      prompt: str,
@@ -65,63 +149,36 @@ class LlamaServerGenerator:
             str: Generated text chunks
         """
         
-        # 기본값 적용
-        generation_params = {
-            "max_tokens": max_tokens if max_tokens is not None else self.default_max_tokens,
-        }
+        # 기본값 위에 값이 제공된 선택적 파라미터만 덮어쓰기
+        generation_params = self._default_params.copy()
+        optional_params = (
+            ("max_tokens", max_tokens),
+            ("temperature", temperature),
+            ("top_p", top_p),
+            ("top_k", top_k),
+            ("frequency_penalty", frequency_penalty),
+            ("presence_penalty", presence_penalty),
+            ("repetition_penalty", repetition_penalty),
+            ("stop", stop),
+            # Tool use parameters
+            ("tools", tools),
+            ("tool_choice", tool_choice if tools is not None else None),
+        )
+        generation_params.update({name: value for name, value in optional_params if value is not None})
         
-        # 선택적 파라미터 추가 (값이 제공된 경우에만)
-        if temperature is not None:
-            generation_params["temperature"] = temperature
-        if top_p is not None:
-            generation_params["top_p"] = top_p
-        
-        # 선택적 파라미터 추가 (값이 제공된 경우에만)
-        if top_k is not None:
-            generation_params["top_k"] = top_k
-        if frequency_penalty is not None:
-            generation_params["frequency_penalty"] = frequency_penalty
-        if presence_penalty is not None:
-            generation_params["presence_penalty"] = presence_penalty
-        if repetition_penalty is not None:
-            generation_params["repetition_penalty"] = repetition_penalty
-        if stop is not None:
-            generation_params["stop"] = stop
-            
-        # Tool use parameters
-        if tools is not None:
-            generation_params["tools"] = tools
-            if tool_choice is not None:
-                generation_params["tool_choice"] = tool_choice
-                
         # 추가 kwargs 병합
         generation_params.update(kwargs)
         
-        if use_chat_format or tools is not None:
+        chat_format = use_chat_format or tools is not None
+        if chat_format:
             # Chat completion format (required for tool use)
-            # Convert prompt to chat format if needed
-            if isinstance(prompt, str):
-                # Parse the prompt to extract system and user messages
-                messages = self._parse_prompt_to_messages(prompt)
-            else:
-                messages = prompt
-                
-            payload = {
-                "model": "/models/A.X-3.1-Light",  # 모델 경로
-                "messages": messages,
-                "stream": True,
-                **generation_params
-            }
-            url = self.chat_url
+            # Parse a string prompt to extract system and user messages
+            messages = self._parse_prompt_to_messages(prompt) if isinstance(prompt, str) else prompt
+            url, body = self.chat_url, {"messages": messages}
         else:
             # Text completion format
-            payload = {
-                "model": "/models/A.X-3.1-Light",  # 모델 경로
-                "prompt": prompt,
-                "stream": True,
-                **generation_params
-            }
-            url = self.completion_url
+            url, body = self.completion_url, {"prompt": prompt}
+        payload = {"model": self.model, **body, "stream": True, **generation_params}
         
         # 로깅 추가 (디버깅용)
         logger.info(f"🚀 Streaming from: {url}")
@@ -131,82 +188,101 @@ class LlamaServerGenerator:
         if tools:
             logger.info(f"🛠️ Tool use enabled with {len(tools)} tools")
         
-        timeout = httpx.Timeout(timeout=600.0, read=600.0, connect=300.0)
+        # 토큰 단위 델타를 짧은 시간창 단위로 모아서 yield (첫 델타는 바로 전송)
+        pending: List[str] = []
+        last_flush = 0.0
         
         try:
-            async with httpx.AsyncClient(timeout=timeout) as client:
-                async with client.stream("POST", url, json=payload) as response:
-                    response.raise_for_status()
-                    
-                    tool_calls_buffer = []
-                    current_tool_call = None
-                    
-                    async for line in response.aiter_lines():
-                        if not line:
+            async with self._client.stream("POST", url, content=orjson.dumps(payload), headers=_JSON_HEADERS) as response:
+                response.raise_for_status()
+                
+                tool_calls_buffer = []
+                current_tool_call = None
+                arguments_scanner = None
+                
+                async for data_bytes in _iter_sse_data(response):
+                    try:
+                        data = orjson.loads(data_bytes)
+                        
+                        choices = data.get("choices")
+                        if not choices:
                             continue
+                        # 프레임마다 choice를 한 번만 꺼내고 이후 키는 .get()으로 한 번씩만 조회
+                        choice = choices[0]
+                        
+                        # Extract text based on format
+                        if chat_format:
+                            # Chat completion format with potential tool calls
+                            delta = choice.get("delta")
+                            if not delta:
+                                continue
                             
-                        if line.startswith("data: "):
-                            data_str = line[6:]  # Remove "data: " prefix
-                            
-                            if data_str == "[DONE]":
-                                break
+                            # Handle tool calls
+                            tool_calls = delta.get("tool_calls")
+                            if tool_calls:
+                                for tool_call in tool_calls:
+                                    # Process tool call
+                                    function = tool_call.get("function")
+                                    if not function:
+                                        continue
+                                    name = function.get("name")
+                                    if name:
+                                        current_tool_call = {
+                                            "name": name,
+                                            "arguments": ""
+                                        }
+                                        arguments_scanner = _JsonObjectScanner()
+                                    arguments = function.get("arguments")
+                                    if not (arguments and current_tool_call):
+                                        continue
+                                    current_tool_call["arguments"] += arguments
+                                    
+                                    # Check if tool call is complete - 누적된 전체 문자열이 아니라 새로 들어온 조각만 스캔
+                                    if arguments_scanner.feed(arguments):
+                                        tool_calls_buffer.append(current_tool_call)
+                                        # Process the tool call (for HTML preservation)
+                                        result = self._process_tool_call(current_tool_call)
+                                        if result:
+                                            # 도구 결과는 모아둔 텍스트 뒤에 바로 전송
+                                            if pending:
+                                                yield "".join(pending)
+                                                pending.clear()
+                                            yield result
+                                        current_tool_call = None
                             
-                            try:
-                                data = json.loads(data_str)
-                                
-                                # Extract text based on format
-                                if use_chat_format or tools is not None:
-                                    # Chat completion format with potential tool calls
-                                    if "choices" in data and len(data["choices"]) > 0:
-                                        choice = data["choices"][0]
-                                        
-                                        # Check for tool calls
-                                        if "delta" in choice:
-                                            delta = choice["delta"]
-                                            
-                                            # Handle tool calls
-                                            if "tool_calls" in delta:
-                                                for tool_call in delta["tool_calls"]:
-                                                    if "function" in tool_call:
-                                                        # Process tool call
-                                                        function = tool_call["function"]
-                                                        if "name" in function:
-                                                            current_tool_call = {
-                                                                "name": function["name"],
-                                                                "arguments": ""
-                                                            }
-                                                        if "arguments" in function and current_tool_call:
-                                                            current_tool_call["arguments"] += function["arguments"]
-                                                        
-                                                        # Check if tool call is complete
-                                                        if current_tool_call and self._is_json_complete(current_tool_call["arguments"]):
-                                                            tool_calls_buffer.append(current_tool_call)
-                                                            # Process the tool call (for HTML preservation)
-                                                            result = self._process_tool_call(current_tool_call)
-                                                            if result:
-                                                                yield result
-                                                            current_tool_call = None
-                                            
-                                            # Handle regular content
-                                            content = delta.get("content", "")
-                                            if content:
-                                                yield content
-                                else:
-                                    # Text completion format
-                                    if "choices" in data and len(data["choices"]) > 0:
-                                        text = data["choices"][0].get("text", "")
-                                        if text:
-                                            yield text
-                                            
-                            except json.JSONDecodeError as e:
-                                logger.warning(f"Failed to parse JSON: {data_str}")
-                                continue
+                            # Handle regular content
+                            content = delta.get("content")
+                            if content:
+                                pending.append(content)
+                        else:
+                            # Text completion format
+                            text = choice.get("text")
+                            if text:
+                                pending.append(text)
                                 
+                    except orjson.JSONDecodeError:
+                        logger.warning(f"Failed to parse JSON: {data_bytes.decode('utf-8', errors='replace')}")
+                        continue
+                    
+                    if pending:
+                        now = time.monotonic()
+                        if len(pending) >= STREAM_COALESCE_CHUNKS or now - last_flush >= STREAM_COALESCE_SECONDS:
+                            yield "".join(pending)
+                            pending.clear()
+                            last_flush = now
+                
+                if pending:
+                    yield "".join(pending)
+                    pending.clear()
+                            
         except httpx.HTTPStatusError as e:
             # 스트리밍 응답에서는 response.text를 직접 읽을 수 없음
             error_msg = f"HTTP {e.response.status_code}"
             logger.error(f"❌ HTTP error: {error_msg}")
             
+            if pending:
+                yield "".join(pending)
+            
             # 에러 응답 본문을 안전하게 읽기
             try:
                 if hasattr(e.response, 'read'):
@@ -221,55 +297,35 @@ class LlamaServerGenerator:
                 
         except httpx.TimeoutException:
             logger.error("❌ Request timeout")
+            if pending:
+                yield "".join(pending)
             yield "Error: Request timeout"
         except Exception as e:
             logger.error(f"❌ Unexpected error: {str(e)}")
+            if pending:
+                yield "".join(pending)
             yield f"Error: {str(e)}"
     
     def _parse_prompt_to_messages(self, prompt: str) -> List[Dict[str, str]]:
         """Parse a formatted prompt string into chat messages"""
-        messages = []
-        
-        # Try to parse the prompt if it's in the special format
-        if "<|im_start|>" in prompt:
-            parts = prompt.split("<|im_start|>")
-            for part in parts[1:]:  # Skip the first empty part
-                if "<|im_end|>" in part:
-                    role_content = part.split("<|im_end|>")[0].strip()
-                    if role_content.startswith("system"):
-                        role = "system"
-                        content = role_content[6:].strip()
-                    elif role_content.startswith("user"):
-                        role = "user"
-                        content = role_content[4:].strip()
-                    elif role_content.startswith("assistant"):
-                        role = "assistant"
-                        content = role_content[9:].strip()
-                    else:
-                        continue
-                    
-                    if content:
-                        messages.append({"role": role, "content": content})
-        else:
-            # Default to user message
-            messages = [{"role": "user", "content": prompt}]
+        # Default to user message
+        if "<|im_start|>" not in prompt:
+            return [{"role": "user", "content": prompt}]
         
+        # 한 번의 정규식 스캔으로 role/content 추출 (닫히지 않은 마지막 assistant 블록은 제외)
+        messages = []
+        for match in _CHAT_TURN_RE.finditer(prompt):
+            content = match.group(2).strip()
+            if content:
+                messages.append({"role": match.group(1), "content": content})
         return messages
     
-    def _is_json_complete(self, json_str: str) -> bool:
-        """Check if a JSON string is complete"""
-        try:
-            json.loads(json_str)
-            return True
-        except:
-            return False
-    
     def _process_tool_call(self, tool_call: Dict[str, Any]) -> Optional[str]:
         """Process a tool call and return any additional content"""
         try:
             # Parse the tool call arguments
             if tool_call["name"] == "process_html_content":
-                args = json.loads(tool_call["arguments"])
+                args = orjson.loads(tool_call["arguments"])
                 if args.get("include_images", False):
                     # Return a signal that images should be preserved
                     return ""  # The actual image handling is done in the query router
@@ -286,9 +342,26 @@ class LlamaServerGenerator:
             yield chunk
 
 
+# 서버 URL별로 하나의 generator(와 커넥션 풀)를 프로세스 전체에서 공유
+_shared_generators: Dict[str, LlamaServerGenerator] = {}
+
+def get_shared_generator(server_url: str = DEFAULT_SERVER_URL) -> LlamaServerGenerator:
+    """Process-wide generator for server_url, created on first use"""
+    generator = _shared_generators.get(server_url)
+    if generator is None:
+        generator = _shared_generators[server_url] = LlamaServerGenerator(server_url)
+    return generator
+
+async def close_shared_generators():
+    """Close the connection pools of every shared generator"""
+    generators = list(_shared_generators.values())
+    _shared_generators.clear()
+    for generator in generators:
+        await generator.aclose()
+
 # Convenience function for quick streaming
 async def stream_llama(prompt: str, 
-                      server_url: str = "http://192.168.10.101:8080",
+                      server_url: str = DEFAULT_SERVER_URL,
                       use_chat_format: bool = False,
                       max_tokens: int = 4096,
                       temperature: float = 0.7,
@@ -313,10 +386,7 @@ async def stream_llama(prompt: str,
     Yields:
         str: Generated text chunks
     """
-    generator = LlamaServerGenerator(
-        server_url,
-        default_max_tokens=max_tokens
-    )
+    generator = get_shared_generator(server_url)
     async for chunk in generator.stream(prompt, 
                                        use_chat_format=use_chat_format, 
                                        max_tokens=max_tokens,
@@ -7,18 +7,50 @@ from util.simple_embedder import SimpleEmbedder
 from util.pdf import clean_text_by_fixed_margins, split_pdf_by_pages, split_pdf_by_section_headings
 from util.embedding import embed_document_sections, embed_query, cosine_similarity
 
-from api.upload import get_upload_router
+from api.upload import get_upload_router, shutdown_pdf_pool
 from api.query import get_query_router
 from api.documents import get_documents_router
-from api.statistics import get_statistics_router
+from api.statistics import get_statistics_router, start_background_tasks, stop_background_tasks
+from llama_server_generator import close_shared_generators
 
 import os
+import asyncio
+import atexit
 import logging
+import queue
 import time
-logging.basicConfig(level=logging.INFO)
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from logging.handlers import QueueHandler, QueueListener
+
+# Handlers only enqueue records; a listener thread does the stderr writes so logging never blocks the event loop
+_log_queue = queue.SimpleQueue()
+_log_listener = QueueListener(_log_queue, logging.StreamHandler(), respect_handler_level=True)
+logging.basicConfig(level=logging.INFO, handlers=[QueueHandler(_log_queue)])
+_log_listener.start()
+atexit.register(_log_listener.stop)
+
+# Worker threads behind asyncio.to_thread / run_in_executor (store calls, parsing, system probes)
+THREAD_POOL_SIZE = int(os.getenv("HAYSTACK_THREAD_POOL_SIZE", "16"))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=THREAD_POOL_SIZE))
+    # Qdrant setup and model loading run in worker threads, concurrently:
+    # importing main makes no network calls and the loop is never blocked
+    await asyncio.gather(
+        asyncio.to_thread(vector_store.ensure_ready),
+        asyncio.to_thread(embedder.warm_up)
+    )
+    start_background_tasks(vector_store)
+    yield
+    await stop_background_tasks()
+    await close_shared_generators()
+    await asyncio.to_thread(shutdown_pdf_pool)
 
 # Initialize FastAPI
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+
 @app.get("/")
 async def root():
     return {"status": "ok"}
@@ -36,7 +68,7 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize vector store and embedder
+# Initialize vector store and embedder (collection setup and model loading happen in lifespan)
 vector_store = SimpleVectorStore(
     url="http://qdrant:6333",
     collection_name="documents",
@@ -45,7 +77,6 @@ vector_store = SimpleVectorStore(
 )
 
 embedder = SimpleEmbedder(model_name="./models/KURE-v1")
-embedder.warm_up()
 
 # Create upload directory if it doesn't exist
 UPLOAD_DIR = "./uploads"
@@ -1,6 +1,6 @@
 import pdfplumber
 import re
-from transformers import AutoTokenizer
+from .tokenizer import get_tokenizer
 from decimal import Decimal
 
 def split_pdf_by_token_window(pdf_path, top_margin_ratio=0, bottom_margin_ratio=0,
@@ -10,7 +10,7 @@ def split_pdf_by_token_window(pdf_path, top_margin_ratio=0, bottom_margin_ratio=
     Splits PDF content into token-based chunks using the BGE/KURE tokenizer.
     Includes estimated start_page for each chunk.
     """
-    tokenizer = AutoTokenizer.from_pretrained(model_name, local_files_only=True)
+    tokenizer = get_tokenizer(model_name)
     page_texts = clean_text_by_fixed_margins(pdf_path, top_margin_ratio, bottom_margin_ratio)
 
     # Encode each page separately to map tokens to pages
@@ -0,0 +1,179 @@
+"""
+Document store helpers shared by the API routers
+Permission checks, permission filters and metadata parsing in one place
+"""
+
+import asyncio
+import functools
+import os
+import unicodedata
+from typing import Any, Callable, Dict, List, Optional
+
+from .simple_document import SimpleDocument
+
+ADMIN = "관리자"
+DEPARTMENT_WIDE_SUFFIX = "_전체"
+
+# Upper bound on vector store calls in flight, so a burst of requests can't occupy the whole default thread pool
+STORE_CONCURRENCY = int(os.getenv("HAYSTACK_STORE_CONCURRENCY", "8"))
+_store_semaphore = asyncio.Semaphore(STORE_CONCURRENCY)
+
+async def run_store_call(func, *args, **kwargs):
+    """Run a blocking vector store call in a worker thread, bounded by HAYSTACK_STORE_CONCURRENCY"""
+    async with _store_semaphore:
+        return await asyncio.to_thread(func, *args, **kwargs)
+
+# Upper bound on documents merged into one bulk write by WriteBatcher
+WRITE_BATCH_DOCS = int(os.getenv("HAYSTACK_WRITE_BATCH_DOCS", "512"))
+
+class WriteBatcher:
+    """
+    Group commit for vector store writes: documents queued by concurrent uploads are
+    merged into one bulk write_documents call, and every caller waits for its own result
+    """
+
+    def __init__(self, vector_store, max_batch_docs: int = WRITE_BATCH_DOCS):
+        self.vector_store = vector_store
+        self.max_batch_docs = max_batch_docs
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def write(self, documents: List[SimpleDocument]):
+        """Queue documents for the next bulk write and wait until they are stored (or the write fails)"""
+        if self._task is None:
+            # Created lazily: routers are built before the event loop runs
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((documents, future))
+        return await future
+
+    async def _run(self):
+        """Background consumer: take whatever is queued (up to max_batch_docs) and write it in one call"""
+        while True:
+            batch = [await self._queue.get()]
+            doc_count = len(batch[0][0])
+            while doc_count < self.max_batch_docs and not self._queue.empty():
+                item = self._queue.get_nowait()
+                batch.append(item)
+                doc_count += len(item[0])
+
+            try:
+                await run_store_call(self.vector_store.write_documents, [doc for docs, _ in batch for doc in docs])
+                results = [None] * len(batch)
+            except Exception as e:
+                if len(batch) == 1:
+                    results = [e]
+                else:
+                    # Retry one upload at a time so a bad batch only fails the uploads that caused it
+                    results = []
+                    for docs, _ in batch:
+                        try:
+                            await run_store_call(self.vector_store.write_documents, docs)
+                            results.append(None)
+                        except Exception as item_error:
+                            results.append(item_error)
+
+            for (_, future), error in zip(batch, results):
+                if future.done():  # caller went away
+                    continue
+                if error is None:
+                    future.set_result(None)
+                else:
+                    future.set_exception(error)
+
+@functools.lru_cache(maxsize=1024)
+def normalize_scope(value):
+    """Request-side sosok/site/filename in the form stored at upload (stripped + NFC); None/"" pass through"""
+    return unicodedata.normalize("NFC", value.strip()) if value else value
+
+def is_admin(sosok, site):
+    """Admins (sosok and site both "관리자") can access every document"""
+    return normalize_scope(sosok) == ADMIN and normalize_scope(site) == ADMIN
+
+def check_document_access(doc_meta, sosok, site):
+    """Check if user has access to document based on sosok/site permissions"""
+    sosok, site = normalize_scope(sosok), normalize_scope(site)
+    # Stored values are stripped/normalized at upload time
+    doc_sosok = doc_meta.get("sosok", "")
+    doc_site = doc_meta.get("site", "")
+
+    # Admin access - can see everything
+    if is_admin(sosok, site):
+        return True
+
+    # Must match sosok
+    if sosok and doc_sosok != sosok:
+        return False
+
+    # Check site access
+    if site:
+        # Check for department-wide access (e.g., "레이더관제부_전체")
+        if site.endswith(DEPARTMENT_WIDE_SUFFIX):
+            # Allow access to all sites in the same sosok
+            return True
+        else:
+            # Exact site match required
+            if doc_site != site:
+                return False
+
+    return True
+
+def compile_access_predicate(sosok, site) -> Callable[[Dict[str, Any]], bool]:
+    """check_document_access specialized for one caller: the sosok/site branches are resolved once, up front"""
+    sosok, site = normalize_scope(sosok), normalize_scope(site)
+    if is_admin(sosok, site):
+        return lambda doc_meta: True
+
+    # "부서_전체" allows every site in the sosok, so only exact sites are compared
+    check_site = bool(site) and not site.endswith(DEPARTMENT_WIDE_SUFFIX)
+    if sosok and check_site:
+        return lambda doc_meta: doc_meta.get("sosok", "") == sosok and doc_meta.get("site", "") == site
+    if sosok:
+        return lambda doc_meta: doc_meta.get("sosok", "") == sosok
+    if check_site:
+        return lambda doc_meta: doc_meta.get("site", "") == site
+    return lambda doc_meta: True
+
+def build_access_filters(sosok, site) -> Dict[str, Any]:
+    """Translate sosok/site permissions into exact-match vector store filters (mirrors check_document_access)"""
+    sosok, site = normalize_scope(sosok), normalize_scope(site)
+    # Admin access - no restriction
+    if is_admin(sosok, site):
+        return {}
+
+    filters = {}
+    if sosok:
+        filters["sosok"] = sosok
+    # "부서_전체" allows every site in the sosok, so only exact sites become a filter
+    if site and not site.endswith(DEPARTMENT_WIDE_SUFFIX):
+        filters["site"] = site
+    return filters
+
+def parse_tags(raw_tags) -> List[str]:
+    """Split a comma-joined tag string (or clean a tag list) into stripped, non-empty tags"""
+    if isinstance(raw_tags, str):
+        return [tag.strip() for tag in raw_tags.split(",") if tag.strip()]
+    return [tag.strip() for tag in raw_tags or [] if isinstance(tag, str) and tag.strip()]
+
+def get_doc_tags(meta) -> List[str]:
+    """Tags of a document, using the list parsed at ingest when present"""
+    tags_list = meta.get("tags_list")
+    if tags_list is not None:
+        return tags_list
+    return parse_tags(meta.get("tags", ""))
+
+async def fetch_docs_filtered(
+    vector_store,
+    sosok: Optional[str],
+    site: Optional[str],
+    extra_filters: Optional[Dict[str, Any]] = None,
+    include_content: bool = False
+) -> List[SimpleDocument]:
+    """Fetch the documents the caller may access, narrowed by extra_filters, off the event loop"""
+    filters = build_access_filters(sosok, site)
+    if extra_filters:
+        filters.update(extra_filters)
+    return await run_store_call(
+        vector_store.filter_documents, filters=filters, include_content=include_content
+    )
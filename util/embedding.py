@@ -3,6 +3,9 @@ from .simple_embedder import SimpleEmbedder
 import numpy as np
 import logging
 
+# Sections sent to the embedding model per call, unless the embedder has its own device-tuned batch_size
+EMBED_BATCH_SIZE = 32
+
 def embed_document_sections(sections, metadata_base, total_pages, embedder):
     embedded_docs = []
     # 문서 제목 추출
@@ -12,19 +15,21 @@ def embed_document_sections(sections, metadata_base, total_pages, embedder):
     texts = []
     docs_metadata = []
     
-    for idx, section in enumerate(sections):
-        if len(section["content"].strip()) < 1:
-            logging.info(f"⏭ Skipping low-content section: {section['title']}")
-            continue
+    # Drop empty sections up front, keeping the original index for section numbering
+    non_empty_sections = [(idx, section) for idx, section in enumerate(sections) if section["content"].strip()]
+    if len(non_empty_sections) < len(sections):
+        logging.info(f"⏭ Skipping {len(sections) - len(non_empty_sections)} low-content section(s)")
+
+    # Fields shared by every section are merged once; each section copies and fills in its own
+    shared_meta = dict(metadata_base)
+    shared_meta["total_pdf_pages"] = total_pages
 
-        meta = {
-            **metadata_base,
-            "section_title": section["title"],
-            "section_id": section.get("section_id", f"{idx + 1}"),
-            "section_number": idx + 1,
-            "page_number": section.get("page_number", section.get("start_page")),
-            "total_pdf_pages": total_pages
-        }
+    for idx, section in non_empty_sections:
+        meta = shared_meta.copy()
+        meta["section_title"] = section["title"]
+        meta["section_id"] = section.get("section_id", f"{idx + 1}")
+        meta["section_number"] = idx + 1
+        meta["page_number"] = section.get("page_number", section.get("start_page"))
 
         # 문서 제목과 섹션 제목 모두 포함하여 임베딩
         content_with_header = f"문서: {document_title}\n<h2>{section['title']}</h2>\n{section['content']}"
@@ -33,9 +38,29 @@ def embed_document_sections(sections, metadata_base, total_pages, embedder):
     
     # Batch embedding for efficiency
     if texts:
-        embeddings = embedder.embed_texts(texts)
+        batch_size = getattr(embedder, "batch_size", None) or EMBED_BATCH_SIZE
+        embeddings = []
+        for start in range(0, len(texts), batch_size):
+            batch = texts[start:start + batch_size]
+            try:
+                embeddings.extend(embedder.embed_texts(batch))
+            except Exception as e:
+                # Fall back to per-section embedding so one bad section doesn't drop the batch
+                logging.warning(f"⚠️ Batch embedding failed, retrying per section: {e}")
+                for text in batch:
+                    try:
+                        embeddings.append(embedder.embed_single(text))
+                    except Exception as e:
+                        logging.error(f"❌ Section embedding failed: {e}")
+                        embeddings.append(None)
         
-        for text, meta, embedding in zip(texts, docs_metadata, embeddings):
+        valid = valid_embedding_mask(embeddings)
+        if not valid.all():
+            logging.warning(f"⚠️ Dropping {int((~valid).sum())} section(s) with missing or invalid embeddings")
+        
+        for text, meta, embedding, is_valid in zip(texts, docs_metadata, embeddings, valid):
+            if not is_valid:
+                continue
             doc = SimpleDocument(content=text, meta=meta, embedding=embedding)
             embedded_docs.append(doc)
             
@@ -45,6 +70,16 @@ def embed_document_sections(sections, metadata_base, total_pages, embedder):
     
     return embedded_docs
 
+def valid_embedding_mask(embeddings):
+    """Boolean mask of embeddings that are present, finite and non-zero, checked in one vectorized pass"""
+    mask = np.zeros(len(embeddings), dtype=bool)
+    present = [i for i, embedding in enumerate(embeddings) if embedding is not None and len(embedding) > 0]
+    if present:
+        matrix = np.asarray([embeddings[i] for i in present], dtype=np.float32)
+        squared_norms = np.einsum("ij,ij->i", matrix, matrix)
+        mask[present] = np.isfinite(matrix).all(axis=1) & (squared_norms > 0)
+    return mask
+
 def embed_query(query_text, embedder):
     embedding = embedder.embed_single(query_text)
     if not embedding or len(embedding) == 0:
@@ -52,8 +87,45 @@ def embed_query(query_text, embedder):
     return embedding
 
 def cosine_similarity(a, b):
-    a = np.array(a)
-    b = np.array(b)
+    # asarray avoids copying inputs that are already float32 arrays
+    a = np.asarray(a, dtype=np.float32)
+    b = np.asarray(b, dtype=np.float32)
     if a.size == 0 or b.size == 0:
         return 0.0
-    return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
\ No newline at end of file
+    denom = np.sqrt(np.dot(a, a) * np.dot(b, b))
+    if denom == 0:
+        return 0.0
+    return float(np.dot(a, b) / denom)
+
+def score_embeddings(matrix, query_embedding):
+    """Cosine scores of a unit-length query against a matrix of unit-length rows in one matmul"""
+    if matrix.shape[0] == 0:
+        return np.zeros(0, dtype=np.float32)
+    return matrix @ np.asarray(query_embedding, dtype=np.float32)
+
+def top_k_distinct_indices(scores, docs, k, candidate_factor=4):
+    """
+    Like top_k_indices, but skips chunks whose content repeats a better-scoring one
+    (e.g. the same file uploaded twice with "keep both"), so the k results carry k distinct texts
+    """
+    selected = []
+    seen_contents = set()
+    for i in top_k_indices(scores, k * candidate_factor):
+        content = docs[i].content
+        if content in seen_contents:
+            continue
+        seen_contents.add(content)
+        selected.append(i)
+        if len(selected) == k:
+            break
+    return selected
+
+def top_k_indices(scores, k):
+    """Indices of the k highest scores, best first, without sorting the whole array"""
+    n = scores.shape[0]
+    if k <= 0 or n == 0:
+        return np.empty(0, dtype=np.intp)
+    if k >= n:
+        return np.argsort(-scores)
+    idx = np.argpartition(-scores, k)[:k]
+    return idx[np.argsort(-scores[idx])]
@@ -1,6 +1,5 @@
 import pdfplumber
 import re
-from transformers import AutoTokenizer
 from decimal import Decimal
 import hashlib
 from collections import Counter, defaultdict
@@ -11,73 +10,82 @@ from datetime import datetime
 from .pdf_image_extractor import extract_images_from_pdf, insert_images_in_text
 from .pdf_table_extractor import extract_tables_as_text
 from .pdf_text_processor import extract_page_content_with_tables
+from ..tokenizer import get_tokenizer
 
 
 class HeaderFooterDetector:
     """PDF 문서의 머리말/꼬리말을 자동으로 탐지하는 클래스"""
     
-    def __init__(self, pdf_path):
+    def __init__(self, pdf_path, pdf=None):
         self.pdf_path = pdf_path
+        self.pdf = pdf  # 이미 열린 pdfplumber 핸들 (있으면 재사용)
         self.header_regions = {}  # page_num: margin_ratio
         self.footer_regions = {}  # page_num: margin_ratio
     
     def detect_header_footer_regions(self):
         """텍스트 패턴을 기반으로 머리말/꼬리말 영역 탐지"""
-        with pdfplumber.open(self.pdf_path) as pdf:
-            total_pages = len(pdf.pages)
+        if self.pdf is not None:
+            self._detect_regions(self.pdf)
+        else:
+            with pdfplumber.open(self.pdf_path) as pdf:
+                self._detect_regions(pdf)
+    
+    def _detect_regions(self, pdf):
+        """열린 PDF 핸들에서 머리말/꼬리말 영역 계산"""
+        total_pages = len(pdf.pages)
+        
+        # 각 페이지의 상단/하단 3줄씩 수집
+        top_lines = [[], [], []]  # 상단 1줄, 2줄, 3줄
+        bottom_lines = [[], [], []]  # 하단 1줄, 2줄, 3줄
+        page_infos = []
+        
+        for page_num, page in enumerate(pdf.pages):
+            page_height = float(page.height)
+            page_width = float(page.width)
             
-            # 각 페이지의 상단/하단 3줄씩 수집
-            top_lines = [[], [], []]  # 상단 1줄, 2줄, 3줄
-            bottom_lines = [[], [], []]  # 하단 1줄, 2줄, 3줄
-            page_infos = []
+            page_data = {
+                "page_num": page_num + 1,
+                "height": page_height,
+                "width": page_width
+            }
             
-            for page_num, page in enumerate(pdf.pages):
-                page_height = float(page.height)
-                page_width = float(page.width)
-                
-                page_data = {
-                    "page_num": page_num + 1,
-                    "height": page_height,
-                    "width": page_width
-                }
-                
-                # 페이지의 각 줄을 Y 위치와 함께 추출
-                lines_with_y = self._extract_lines_with_positions(page)
-                
-                if lines_with_y:
-                    # 상단 3줄 수집
-                    for i in range(min(3, len(lines_with_y))):
-                        line_info = lines_with_y[i]
-                        top_lines[i].append({
-                            "page_num": page_num,
-                            "text": line_info["text"],
-                            "y_start": line_info["y_start"],
-                            "y_end": line_info["y_end"],
-                            "avg_y": line_info.get("avg_y", (line_info["y_start"] + line_info["y_end"]) / 2)
-                        })
-                    
-                    # 하단 3줄 수집 (역순)
-                    for i in range(min(3, len(lines_with_y))):
-                        line_info = lines_with_y[-(i+1)]
-                        bottom_lines[i].append({
-                            "page_num": page_num,
-                            "text": line_info["text"],
-                            "y_start": line_info["y_start"],
-                            "y_end": line_info["y_end"],
-                            "avg_y": line_info.get("avg_y", (line_info["y_start"] + line_info["y_end"]) / 2)
-                        })
-                
-                page_infos.append(page_data)
+            # 페이지의 각 줄을 Y 위치와 함께 추출
+            lines_with_y = self._extract_lines_with_positions(page)
             
-            # 각 줄별로 반복 패턴 분석
-            header_separator_line = self._find_separator_line(top_lines, total_pages, is_header=True)
-            footer_separator_line = self._find_separator_line(bottom_lines, total_pages, is_header=False)
+            if lines_with_y:
+                # 상단 3줄 수집
+                for i in range(min(3, len(lines_with_y))):
+                    line_info = lines_with_y[i]
+                    top_lines[i].append({
+                        "page_num": page_num,
+                        "text": line_info["text"],
+                        "y_start": line_info["y_start"],
+                        "y_end": line_info["y_end"],
+                        "avg_y": line_info.get("avg_y", (line_info["y_start"] + line_info["y_end"]) / 2)
+                    })
+                
+                # 하단 3줄 수집 (역순)
+                for i in range(min(3, len(lines_with_y))):
+                    line_info = lines_with_y[-(i+1)]
+                    bottom_lines[i].append({
+                        "page_num": page_num,
+                        "text": line_info["text"],
+                        "y_start": line_info["y_start"],
+                        "y_end": line_info["y_end"],
+                        "avg_y": line_info.get("avg_y", (line_info["y_start"] + line_info["y_end"]) / 2)
+                    })
             
-            # 탐지된 구분선으로 영역 설정
-            self._set_regions_from_separator_lines(
-                pdf, page_infos, header_separator_line, footer_separator_line
-            )
-    
+            page_infos.append(page_data)
+        
+        # 각 줄별로 반복 패턴 분석
+        header_separator_line = self._find_separator_line(top_lines, total_pages, is_header=True)
+        footer_separator_line = self._find_separator_line(bottom_lines, total_pages, is_header=False)
+        
+        # 탐지된 구분선으로 영역 설정
+        self._set_regions_from_separator_lines(
+            pdf, page_infos, header_separator_line, footer_separator_line
+        )
+
     def _extract_lines_with_positions(self, page):
         """페이지에서 각 줄을 Y 위치와 함께 추출 - 개선된 버전"""
         try:
@@ -462,9 +470,9 @@ class HeaderFooterDetector:
         return avg_top_margin, avg_bottom_margin
 
 
-def auto_detect_margins(pdf_path):
+def auto_detect_margins(pdf_path, pdf=None):
     """PDF의 머리말/꼬리말 영역을 자동으로 탐지하여 margin ratio 반환"""
-    detector = HeaderFooterDetector(pdf_path)
+    detector = HeaderFooterDetector(pdf_path, pdf=pdf)
     top_margin, bottom_margin = detector.get_margin_ratios()
     
     print(f"🔍 자동 탐지된 margin - 상단: {top_margin*100:.3f}%, 하단: {bottom_margin*100:.3f}%")
@@ -480,21 +488,22 @@ def clean_text_by_fixed_margins_with_tables(pdf_path, top_margin_ratio=0.15, bot
     Enhanced to extract text and tables separately, then combine them in order.
     Now with automatic header/footer detection option.
     """
-    # 자동 머리말/꼬리말 탐지
-    if auto_detect_header_footer:
-        detected_top, detected_bottom = auto_detect_margins(pdf_path)
-        # 자동 탐지된 값이 있으면 사용, 없으면 기본값 사용
-        if detected_top > 0:
-            top_margin_ratio = detected_top
-        if detected_bottom > 0:
-            bottom_margin_ratio = detected_bottom
-    
-    top_margin_ratio = float(top_margin_ratio)
-    bottom_margin_ratio = float(bottom_margin_ratio)
-    
     cleaned_pages = []
     
+    # 머리말/꼬리말 탐지와 본문 추출이 같은 PDF 핸들을 공유하도록 한 번만 연다
     with pdfplumber.open(pdf_path) as pdf:
+        # 자동 머리말/꼬리말 탐지
+        if auto_detect_header_footer:
+            detected_top, detected_bottom = auto_detect_margins(pdf_path, pdf=pdf)
+            # 자동 탐지된 값이 있으면 사용, 없으면 기본값 사용
+            if detected_top > 0:
+                top_margin_ratio = detected_top
+            if detected_bottom > 0:
+                bottom_margin_ratio = detected_bottom
+        
+        top_margin_ratio = float(top_margin_ratio)
+        bottom_margin_ratio = float(bottom_margin_ratio)
+        
         for page_num, page in enumerate(pdf.pages, start=1):
             page_height = float(page.height)
             
@@ -569,7 +578,7 @@ def split_pdf_by_token_window(pdf_path, top_margin_ratio=0, bottom_margin_ratio=
         auto_detect_header_footer=auto_detect_header_footer
     )
     
-    tokenizer = AutoTokenizer.from_pretrained(model_name, local_files_only=True)
+    tokenizer = get_tokenizer(model_name)
 
     # Encode each page separately to map tokens to pages
     page_token_boundaries = []
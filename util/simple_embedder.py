@@ -4,29 +4,38 @@ Replaces Haystack SentenceTransformersDocumentEmbedder with direct calls
 """
 
 import logging
-from typing import List, Union
+from typing import List, Optional, Union
 import numpy as np
 from sentence_transformers import SentenceTransformer
 
 class SimpleEmbedder:
     """Direct sentence-transformers embedder without Haystack wrapper"""
     
-    def __init__(self, model_name: str = "./models/KURE-v1"):
+    # Texts per forward pass when no batch_size is given, picked by the device the model lands on
+    GPU_BATCH_SIZE = 64
+    CPU_BATCH_SIZE = 16
+    
+    def __init__(self, model_name: str = "./models/KURE-v1", batch_size: Optional[int] = None):
         """
         Initialize the embedder with a sentence-transformers model
         
         Args:
             model_name: Path to model or HuggingFace model name
+            batch_size: Texts per forward pass (default: GPU_BATCH_SIZE on CUDA, else CPU_BATCH_SIZE)
         """
         self.model_name = model_name
         self.model = None
+        self.batch_size = batch_size
         logging.info(f"📦 Initializing SimpleEmbedder with model: {model_name}")
     
     def warm_up(self):
         """Load the model into memory"""
         try:
             self.model = SentenceTransformer(self.model_name)
-            logging.info(f"✅ Model {self.model_name} loaded successfully")
+            if self.batch_size is None:
+                on_gpu = self.model.device.type == "cuda"
+                self.batch_size = self.GPU_BATCH_SIZE if on_gpu else self.CPU_BATCH_SIZE
+            logging.info(f"✅ Model {self.model_name} loaded successfully (batch size {self.batch_size})")
         except Exception as e:
             logging.error(f"❌ Failed to load model {self.model_name}: {e}")
             raise
@@ -48,7 +57,14 @@ class SimpleEmbedder:
             return []
         
         try:
-            embeddings = self.model.encode(texts, convert_to_tensor=False)
+            # Unit-length output: cosine similarity downstream is a plain dot product
+            embeddings = self.model.encode(
+                texts,
+                batch_size=self.batch_size or self.CPU_BATCH_SIZE,
+                convert_to_tensor=False,
+                normalize_embeddings=True,
+                show_progress_bar=False
+            )
             # Convert numpy arrays to lists for JSON serialization
             return [emb.tolist() if isinstance(emb, np.ndarray) else emb for emb in embeddings]
         except Exception as e:
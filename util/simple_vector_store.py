@@ -4,9 +4,16 @@ Replaces Haystack QdrantDocumentStore with direct qdrant-client calls
 """
 
 import logging
-from typing import List, Dict, Any, Optional, Union
+import os
+import threading
+import time
+from typing import List, Dict, Any, Optional, Tuple, Union
+import numpy as np
 from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams, PointStruct, Filter, FieldCondition, Range, MatchValue
+from qdrant_client.models import (
+    Distance, VectorParams, Filter, FieldCondition, Range, MatchValue, MatchAny,
+    PayloadSchemaType
+)
 from qdrant_client.http import models
 import uuid
 
@@ -15,12 +22,28 @@ from .simple_document import SimpleDocument
 class SimpleVectorStore:
     """Direct Qdrant client wrapper without Haystack dependencies"""
     
+    # Payload fields used in exact-match filters by the API routers
+    KEYWORD_INDEX_FIELDS = ("sosok", "site", "file_id", "original_filename", "content_sha")
+    
+    # Maximum number of distinct filter results kept in the filter cache
+    FILTER_CACHE_SIZE = 16
+    
+    # Total rows across cached embedding matrices (~4 KiB of float32 per row at 1024 dims)
+    MATRIX_CACHE_MAX_ROWS = int(os.getenv("HAYSTACK_MATRIX_CACHE_ROWS", "100000"))
+    
+    # Points fetched per scroll request
+    SCROLL_PAGE_SIZE = 10000
+    
+    # Upper bound on distinct values returned by a facet count
+    FACET_LIMIT = 100000
+    
     def __init__(
         self, 
         url: str = "http://qdrant:6333",
         collection_name: str = "documents",
         embedding_dim: int = 1024,
-        recreate_collection: bool = False
+        recreate_collection: bool = False,
+        cache_ttl: float = 30.0
     ):
         """
         Initialize the vector store
@@ -30,22 +53,38 @@ class SimpleVectorStore:
             collection_name: Name of the collection
             embedding_dim: Dimension of embeddings
             recreate_collection: Whether to recreate the collection
+            cache_ttl: Seconds a filter_documents result is reused (0 disables the cache)
         """
         self.url = url
         self.collection_name = collection_name
         self.embedding_dim = embedding_dim
+        self.cache_ttl = cache_ttl
+        self.recreate_collection = recreate_collection
         self.client = None
         
-        logging.info(f"📦 Initializing SimpleVectorStore: {url}/{collection_name}")
+        # filter_documents results keyed by filter, embedding matrices keyed by permission scope; cleared on every write/delete
+        self._filter_cache: Dict[tuple, tuple] = {}
+        self._matrix_cache: Dict[tuple, tuple] = {}
+        self._cache_lock = threading.Lock()
+        # Bumped by every invalidation; a scroll that overlapped a write must not cache its pre-write result
+        self._cache_generation = 0
         
-        # Initialize client
+        logging.info(f"📦 Initializing SimpleVectorStore: {url}/{collection_name}")
+    
+    def ensure_ready(self):
+        """
+        Connect and set up the collection and its payload indexes
+        Blocking network calls, so they run once at application startup rather than at construction
+        """
+        # Initialize client (recent qdrant-client versions already contact the server here)
         self._connect()
         
-        # Setup collection
-        if recreate_collection:
+        if self.recreate_collection:
             self._recreate_collection()
         else:
             self._ensure_collection_exists()
+        
+        self._ensure_payload_indexes()
     
     def _connect(self):
         """Connect to Qdrant server"""
@@ -82,6 +121,18 @@ class SimpleVectorStore:
         )
         logging.info(f"✅ Created collection: {self.collection_name}")
     
+    def _ensure_payload_indexes(self):
+        """Index the metadata fields that API filters match on so Qdrant can do indexed lookups"""
+        for field_name in self.KEYWORD_INDEX_FIELDS:
+            try:
+                self.client.create_payload_index(
+                    collection_name=self.collection_name,
+                    field_name=field_name,
+                    field_schema=PayloadSchemaType.KEYWORD
+                )
+            except Exception as e:
+                logging.warning(f"⚠️ Could not create payload index for {field_name}: {e}")
+    
     def _recreate_collection(self):
         """Delete and recreate collection"""
         try:
@@ -92,6 +143,62 @@ class SimpleVectorStore:
         
         self._create_collection()
     
+    @staticmethod
+    def _filter_cache_key(filters: Optional[Dict[str, Any]]) -> tuple:
+        """Hashable, order-independent key for a filters dict"""
+        if not filters:
+            return ()
+        return tuple(sorted(
+            (key, tuple(value) if isinstance(value, (list, tuple, set, frozenset)) else value)
+            for key, value in filters.items()
+        ))
+    
+    @property
+    def write_generation(self) -> int:
+        """Counter bumped by every write/delete/update; unchanged means the collection is unchanged"""
+        return self._cache_generation
+    
+    def invalidate_cache(self):
+        """Drop all cached filter_documents results"""
+        with self._cache_lock:
+            self._cache_generation += 1
+            self._filter_cache.clear()
+            self._matrix_cache.clear()
+    
+    def _get_cached(self, cache: Dict[tuple, tuple], key: tuple):
+        """Return the cached value for key if it is still fresh, else None"""
+        if self.cache_ttl <= 0:
+            return None
+        with self._cache_lock:
+            entry = cache.get(key)
+        if entry and time.monotonic() - entry[0] < self.cache_ttl:
+            return entry[1]
+        return None
+    
+    def _put_cached(
+        self, cache: Dict[tuple, tuple], key: tuple, value, generation: int,
+        cost: int = 1, max_cost: int = FILTER_CACHE_SIZE
+    ):
+        """
+        Store value under key, evicting the oldest entries until the cache's total cost fits max_cost
+        Skipped if the cache was invalidated since generation (read before the value was fetched)
+        """
+        if self.cache_ttl <= 0 or cost > max_cost:
+            return
+        with self._cache_lock:
+            if generation != self._cache_generation:
+                return
+            now = time.monotonic()
+            # Expired entries are released now instead of lingering until the cache fills up
+            for stale_key in [k for k, entry in cache.items() if now - entry[0] >= self.cache_ttl]:
+                del cache[stale_key]
+            cache.pop(key, None)
+            total_cost = sum(entry[2] for entry in cache.values())
+            while cache and total_cost + cost > max_cost:
+                oldest_key = min(cache, key=lambda k: cache[k][0])
+                total_cost -= cache.pop(oldest_key)[2]
+            cache[key] = (now, value, cost)
+    
     def write_documents(self, documents: List[SimpleDocument]):
         """
         Write documents to the vector store
@@ -103,29 +210,31 @@ class SimpleVectorStore:
             logging.warning("No documents to write")
             return
         
-        points = []
-        for doc in documents:
-            if doc.embedding is None:
-                logging.warning(f"Skipping document {doc.id} - no embedding")
-                continue
-            
-            point = PointStruct(
-                id=str(uuid.uuid4()),  # Use random UUID as point ID
-                vector=doc.embedding,
-                payload={
-                    "doc_id": doc.id,  # Store original document ID in payload
-                    "content": doc.content,
-                    **doc.meta
-                }
-            )
-            points.append(point)
+        embedded = [doc for doc in documents if doc.embedding is not None]
+        if len(embedded) < len(documents):
+            logging.warning(f"Skipping {len(documents) - len(embedded)} document(s) - no embedding")
+        if not embedded:
+            return
+        documents = embedded
         
-        if points:
-            self.client.upsert(
-                collection_name=self.collection_name,
-                points=points
-            )
-            logging.info(f"✅ Wrote {len(points)} documents to vector store")
+        # Columnar batch: one (N, D) float32 matrix plus parallel id/payload lists, instead of N PointStruct models
+        vectors = np.asarray([doc.embedding for doc in documents], dtype=np.float32)
+        ids = [str(uuid.uuid4()) for _ in documents]  # Use random UUIDs as point IDs
+        payloads = [
+            {
+                "doc_id": doc.id,  # Store original document ID in payload
+                "content": doc.content,
+                **doc.meta
+            }
+            for doc in documents
+        ]
+        
+        self.client.upsert(
+            collection_name=self.collection_name,
+            points=models.Batch(ids=ids, vectors=vectors.tolist(), payloads=payloads)
+        )
+        self.invalidate_cache()
+        logging.info(f"✅ Wrote {len(documents)} documents to vector store")
     
     def search_similar(
         self, 
@@ -179,28 +288,131 @@ class SimpleVectorStore:
             logging.error(f"❌ Search failed: {e}")
             raise
     
-    def filter_documents(self, filters: Optional[Dict[str, Any]] = None) -> List[SimpleDocument]:
+    def filter_documents(
+        self,
+        filters: Optional[Dict[str, Any]] = None,
+        include_content: bool = True
+    ) -> List[SimpleDocument]:
         """
         Filter documents by metadata
         
+        Results are cached per filter for cache_ttl seconds; callers must not mutate the returned documents.
+        
         Args:
             filters: Dictionary of filters to apply
+            include_content: Fetch the chunk text; pass False when only metadata is needed
             
         Returns:
             List of matching documents
         """
+        cache_key = (include_content,) + self._filter_cache_key(filters)
+        cached = self._get_cached(self._filter_cache, cache_key)
+        if cached is not None:
+            return list(cached)
+        
+        generation = self._cache_generation
+        documents = self._scroll_documents(filters, include_content=include_content)
+        self._put_cached(self._filter_cache, cache_key, documents, generation)
+        return list(documents)
+    
+    def get_embedding_matrix(self, filters: Optional[Dict[str, Any]] = None) -> Tuple[List[SimpleDocument], np.ndarray]:
+        """
+        Fetch documents matching filters with their embeddings stacked for vectorized scoring
+        
+        One matrix is cached per permission scope (every filter except original_filename);
+        a filename selection is served by masking rows of that matrix.
+        
+        Args:
+            filters: Dictionary of filters to apply
+            
+        Returns:
+            (documents, matrix) where matrix is a contiguous float32 (N, D) array of
+            unit-length embeddings and row i belongs to documents[i]
+        """
+        scope_filters = dict(filters or {})
+        selected_names = scope_filters.pop("original_filename", None)
+        
+        documents, matrix, name_codes, code_by_name = self._get_scope_matrix(scope_filters)
+        if selected_names is None:
+            return documents, matrix
+        
+        if isinstance(selected_names, str):
+            selected_names = [selected_names]
+        selected_codes = [code_by_name[name] for name in selected_names if name in code_by_name]
+        mask = np.isin(name_codes, selected_codes)
+        rows = np.flatnonzero(mask)
+        return [documents[i] for i in rows], matrix[mask]
+    
+    def _get_scope_matrix(self, scope_filters: Dict[str, Any]):
+        """Cached (documents, matrix, filename codes, code by filename) for one permission scope"""
+        cache_key = self._filter_cache_key(scope_filters)
+        cached = self._get_cached(self._matrix_cache, cache_key)
+        if cached is not None:
+            return cached
+        
+        generation = self._cache_generation
+        documents = [
+            doc for doc in self._scroll_documents(scope_filters or None, with_vectors=True)
+            if doc.embedding is not None and len(doc.embedding) > 0
+        ]
+        if documents:
+            # COSINE collections store vectors normalized on upsert, so rows are already unit-length
+            matrix = np.array([doc.embedding for doc in documents], dtype=np.float32)
+            # The matrix holds the vectors now; drop the per-document float lists
+            for doc in documents:
+                doc.embedding = None
+        else:
+            matrix = np.empty((0, self.embedding_dim), dtype=np.float32)
+        
+        # Filenames as small ints so a selection becomes one vectorized row mask
+        code_by_name: Dict[str, int] = {}
+        name_codes = np.fromiter(
+            (code_by_name.setdefault(doc.meta.get("original_filename", ""), len(code_by_name)) for doc in documents),
+            dtype=np.int64,
+            count=len(documents)
+        )
+        
+        result = (documents, matrix, name_codes, code_by_name)
+        self._put_cached(
+            self._matrix_cache, cache_key, result, generation,
+            cost=len(documents), max_cost=self.MATRIX_CACHE_MAX_ROWS
+        )
+        return result
+    
+    def _scroll_all(self, scroll_filter: Optional[Filter], with_payload, with_vectors: bool) -> list:
+        """Scroll through every matching point page by page (a single scroll call stops at its limit)"""
+        results = []
+        offset = None
+        while True:
+            page, offset = self.client.scroll(
+                collection_name=self.collection_name,
+                scroll_filter=scroll_filter,
+                with_payload=with_payload,
+                with_vectors=with_vectors,
+                limit=self.SCROLL_PAGE_SIZE,
+                offset=offset
+            )
+            results.extend(page)
+            if offset is None:
+                return results
+    
+    def _scroll_documents(
+        self,
+        filters: Optional[Dict[str, Any]] = None,
+        with_vectors: bool = False,
+        include_content: bool = True
+    ) -> List[SimpleDocument]:
+        """Fetch all documents matching filters from Qdrant (uncached)"""
         filter_conditions = None
         if filters:
             filter_conditions = self._build_filter(filters)
         
         try:
             # Use scroll to get all matching documents
-            results, _ = self.client.scroll(
-                collection_name=self.collection_name,
-                scroll_filter=filter_conditions,
-                with_payload=True,
-                with_vectors=False,
-                limit=10000  # Large limit to get all results
+            results = self._scroll_all(
+                filter_conditions,
+                with_payload=True if include_content else models.PayloadSelectorExclude(exclude=["content"]),
+                with_vectors=with_vectors
             )
             
             documents = []
@@ -212,7 +424,8 @@ class SimpleVectorStore:
                 doc = SimpleDocument(
                     id=doc_id,
                     content=content,
-                    meta=payload
+                    meta=payload,
+                    embedding=result.vector if with_vectors else None
                 )
                 documents.append(doc)
             
@@ -223,6 +436,24 @@ class SimpleVectorStore:
             logging.error(f"❌ Filter failed: {e}")
             raise
     
+    def scroll_payloads(
+        self,
+        fields: List[str],
+        filters: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """Fetch only the given payload fields of all matching points (no content, no vectors, uncached)"""
+        filter_conditions = None
+        if filters:
+            filter_conditions = self._build_filter(filters)
+        
+        try:
+            results = self._scroll_all(filter_conditions, with_payload=list(fields), with_vectors=False)
+            return [result.payload or {} for result in results]
+            
+        except Exception as e:
+            logging.error(f"❌ Payload scroll failed: {e}")
+            raise
+    
     def delete_documents(self, document_ids: List[str]):
         """
         Delete documents by their IDs
@@ -248,6 +479,7 @@ class SimpleVectorStore:
                 collection_name=self.collection_name,
                 points_selector=models.FilterSelector(filter=filter_condition)
             )
+            self.invalidate_cache()
             
             logging.info(f"🗑️ Deleted {len(document_ids)} documents")
             
@@ -255,6 +487,30 @@ class SimpleVectorStore:
             logging.error(f"❌ Delete failed: {e}")
             raise
     
+    def update_documents_meta(self, filters: Dict[str, Any], meta: Dict[str, Any]):
+        """
+        Set metadata fields in place on every document matching filters
+        
+        Args:
+            filters: Dictionary of filters selecting the documents (must not be empty)
+            meta: Metadata fields to set; vectors and other fields are left untouched
+        """
+        filter_condition = self._build_filter(filters) if filters else None
+        if filter_condition is None:
+            raise ValueError("update_documents_meta requires a non-empty filter")
+        
+        try:
+            self.client.set_payload(
+                collection_name=self.collection_name,
+                payload=meta,
+                points=models.FilterSelector(filter=filter_condition)
+            )
+            self.invalidate_cache()
+            logging.info(f"✏️ Updated metadata {list(meta.keys())} for documents matching {filters}")
+        except Exception as e:
+            logging.error(f"❌ Metadata update failed: {e}")
+            raise
+    
     def _build_filter(self, filters: Dict[str, Any]) -> Filter:
         """Build Qdrant filter from dictionary"""
         conditions = []
@@ -268,14 +524,42 @@ class SimpleVectorStore:
                 conditions.append(
                     FieldCondition(key=key, match=MatchValue(value=value))
                 )
-            elif isinstance(value, list):
-                # Multiple possible values
+            elif isinstance(value, (list, tuple, set, frozenset)):
+                # Multiple possible values - match any of them
                 conditions.append(
-                    FieldCondition(key=key, match=MatchValue(value=value[0]))  # Simplified
+                    FieldCondition(key=key, match=MatchAny(any=list(value)))
                 )
         
         return Filter(must=conditions) if conditions else None
     
+    def count_documents(self, filters: Optional[Dict[str, Any]] = None) -> int:
+        """Number of points (sections) matching filters, counted by Qdrant"""
+        count_filter = self._build_filter(filters) if filters else None
+        return self.client.count(
+            collection_name=self.collection_name,
+            count_filter=count_filter,
+            exact=True
+        ).count
+    
+    def count_unique(self, key: str, filters: Optional[Dict[str, Any]] = None) -> int:
+        """Number of distinct values of a keyword-indexed payload field (e.g. file_id)"""
+        facet_filter = self._build_filter(filters) if filters else None
+        try:
+            # Qdrant aggregates the index server-side and returns one hit per distinct value
+            response = self.client.facet(
+                collection_name=self.collection_name,
+                key=key,
+                facet_filter=facet_filter,
+                limit=self.FACET_LIMIT,
+                exact=True
+            )
+            return len(response.hits)
+        except Exception as e:
+            # Facets need Qdrant >= 1.12; fall back to scrolling just that field
+            logging.warning(f"⚠️ Facet count on {key} failed, scrolling instead: {e}")
+            payloads = self.scroll_payloads([key], filters)
+            return len({payload[key] for payload in payloads if payload.get(key)})
+    
     def get_collection_info(self) -> Dict[str, Any]:
         """Get information about the collection"""
         try:
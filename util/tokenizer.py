@@ -0,0 +1,13 @@
+from transformers import AutoTokenizer
+
+# Tokenizers keyed by model path, loaded once per process
+_TOKENIZER_CACHE = {}
+
+def get_tokenizer(model_name="./models/KURE-v1"):
+    """Return a cached tokenizer for model_name, loading it on first use"""
+    tokenizer = _TOKENIZER_CACHE.get(model_name)
+    if tokenizer is None:
+        # Fast (Rust) tokenizer: batch encoding runs outside the GIL
+        tokenizer = AutoTokenizer.from_pretrained(model_name, local_files_only=True, use_fast=True)
+        _TOKENIZER_CACHE[model_name] = tokenizer
+    return tokenizer